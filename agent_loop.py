@@ -1,8 +1,12 @@
 from google import genai
 from google.genai import types
 import utils
-from tools import mobile, edit, bash, search, web_fetch, multimedia_reader
+from tools import mobile, edit, bash, jobs, search, web_fetch, multimedia_reader, workspace_search, datasheets
 from tools.base import ToolError
+from tools.media_pipeline import MediaPipeline
+from dispatcher import ToolDispatcher
+from runtime import AgentRuntime
+from context_window import ContextWindow
 import prompt
 import logging
 from google.genai import types
@@ -14,53 +18,47 @@ import time
 MAX_ITER = 50
 
 
-async def run_agent(user_prompt: str, messages: list, workspace_directory: str) -> list: 
-    messages_file_path = os.path.join(workspace_directory, ".actualCodeMessagesData")
-    client = genai.Client()
-    mobileTool = mobile.MobileTool()
-    editTool = edit.EditTool(workspace_directory)
-    bashTool = bash.BashTool(workspace_directory)
-    searchTool = search.SearchTool(workspace_directory, client)
-    webFetchTool = web_fetch.WebFetchTool(workspace_directory, client)
-    multimediaReaderTool = multimedia_reader.MultimediaReaderTool(workspace_directory, client)
-    
-    function_declarations = mobileTool.definitions + editTool.definitions + bashTool.definitions + searchTool.definitions + webFetchTool.definitions + multimediaReaderTool.definitions
-    tools = types.Tool(function_declarations=function_declarations)
-    config = types.GenerateContentConfig(tools=[tools, ], 
-                                         system_instruction=None, # Experimental -> do not put system prompt.
-                                         temperature=0.0,
-                                         #media_resolution="MEDIA_RESOLUTION_HIGH", # this doesn't work?                                 
-    )
+async def run_agent(user_prompt: str, messages: list, runtime: AgentRuntime) -> list: 
+    workspace_directory = runtime.workspace_directory
+    messages_file_path = runtime.messages_file_path
+    client = runtime.client
+    mobileTool = runtime.mobileTool
+    editTool = runtime.editTool
+    bashTool = runtime.bashTool
+    jobTool = runtime.jobTool
+    searchTool = runtime.searchTool
+    workspaceSearchTool = runtime.workspaceSearchTool
+    webFetchTool = runtime.webFetchTool
+    multimediaReaderTool = runtime.multimediaReaderTool
+    datasheetQueryTool = runtime.datasheetQueryTool
+    config = runtime.config
+    mediaPipeline = runtime.mediaPipeline
+    contextWindow = runtime.contextWindow
     if len(messages) == 0: # First, add system prompt
         messages.append(types.Content(role="user", parts=[types.Part(text=prompt.SYSTEM_PROMPT)]))
         messages.append(types.Content(role="model", parts=[types.Part(text="Understood.")]))
 
     
-    workspace_files = await utils.workspace_files(workspace_directory)
+    workspace_files = runtime.render_workspace()
     messages.append(types.Content(role="user", parts=[types.Part(text=workspace_files), types.Part(text=user_prompt)]))
-    
-    logging.warning("Calling Gemini")
-    startTime = time.time()
-    response = client.models.generate_content_stream(
-        model="gemini-2.5-flash",
-        contents=messages,
-        config=config,
-    )
-    response_text = ""
-    response_function_calls = []
-    for chunk in response:
-        parts = chunk.candidates[0].content.parts
-        for part in parts:
-            if part.text:
-                response_text += part.text
-                print(part.text, end="")
-            if part.function_call:
-                response_function_calls.append(part.function_call)
-    print()
-    logging.warning(f"Gemini response complete in {time.time() - startTime}")
-    
-    
-    messages.append(types.Content(role="model", parts = [types.Part(text=response_text)] + [types.Part.from_function_call(name=function_call.name, args=function_call.args) for function_call in response_function_calls]))
+    runtime.workspace_entries.append(messages[-1])
+    contextWindow.pin(messages[2]) # The original goal stays in context for the whole session
+
+    handlers = {
+        "request_photo_tool": lambda function_name, function_args: handle_request_photo_tool(client, mobileTool, function_name, function_args, workspace_directory, mediaPipeline),
+        "request_video_tool": lambda function_name, function_args: handle_request_video_tool(client, mobileTool, function_name, function_args, workspace_directory, mediaPipeline),
+        "text_editor_tool": lambda function_name, function_args: handle_text_editor_tool(client, editTool, function_name, function_args, workspace_directory),
+        "bash_tool": lambda function_name, function_args: handle_bash_tool(client, bashTool, function_name, function_args, workspace_directory),
+        "bash_job_tool": lambda function_name, function_args: handle_bash_job_tool(client, jobTool, function_name, function_args, workspace_directory),
+        "search_tool": lambda function_name, function_args: handle_search_tool(client, searchTool, function_name, function_args, workspace_directory),
+        "workspace_search_tool": lambda function_name, function_args: handle_workspace_search_tool(client, workspaceSearchTool, function_name, function_args, workspace_directory),
+        "web_fetch_tool": lambda function_name, function_args: handle_web_fetch_tool(client, webFetchTool, function_name, function_args, workspace_directory),
+        "multimedia_reader_tool": lambda function_name, function_args: handle_multimedia_reader_tool(client, multimediaReaderTool, function_name, function_args, workspace_directory),
+        "datasheet_query_tool": lambda function_name, function_args: handle_datasheet_query_tool(client, datasheetQueryTool, function_name, function_args, workspace_directory),
+    }
+
+    toolDispatcher = ToolDispatcher(handlers)
+    response_function_calls = await call_gemini(client, messages, config, toolDispatcher, contextWindow)
     utils.save_messages(messages_file_path, messages)
     
     iter = 0
@@ -70,48 +68,59 @@ async def run_agent(user_prompt: str, messages: list, workspace_directory: str)
         if len(response_function_calls) == 0: break # No function called. Job done
         parts = []
         uploaded_files = []
-        tasks = []
-        
-        for function_call_data in response_function_calls:
-            function_args = function_call_data.args
-            function_name = function_call_data.name
-            if function_name == "request_photo_tool":
-                tasks.append(handle_request_photo_tool(client, mobileTool, function_name, function_args, workspace_directory))
-            elif function_name == "request_video_tool":
-                tasks.append(handle_request_video_tool(client, mobileTool, function_name, function_args, workspace_directory))
-            elif function_name == "text_editor_tool":
-                tasks.append(handle_text_editor_tool(client, editTool, function_name, function_args, workspace_directory))
-            elif function_name == "bash_tool":
-                tasks.append(handle_bash_tool(client, bashTool, function_name, function_args, workspace_directory))
-            elif function_name == "search_tool":
-                tasks.append(handle_search_tool(client, searchTool, function_name, function_args, workspace_directory))
-            elif function_name == "web_fetch_tool":
-                tasks.append(handle_web_fetch_tool(client, webFetchTool, function_name, function_args, workspace_directory))
-            elif function_name == "multimedia_reader_tool":
-                tasks.append(handle_multimedia_reader_tool(client, multimediaReaderTool, function_name, function_args, workspace_directory))
-            else:
-                raise ValueError(f"Function {function_name} not found!") 
-               
-        results = await asyncio.gather(*tasks)
+
+        results = await toolDispatcher.results()
         for new_parts, new_uploaded_files in results:
             parts += new_parts
             uploaded_files += new_uploaded_files
             
-        workspace_files = await utils.workspace_files(workspace_directory)
+        # Only send what changed in the workspace, unless part of the picture fell out of the context window
+        workspace_files = runtime.render_workspace()
         messages.append(types.Content(role="user", parts=[types.Part(text=workspace_files)] + parts))
+        runtime.workspace_entries.append(messages[-1])
         messages += uploaded_files # Take care of uploaded files
         
-        logging.warning("Calling Gemini")
-        startTime = time.time()
-        response = client.models.generate_content_stream(
-            model="gemini-2.5-flash",
-            contents=messages,
-            config=config,
-        )
-        response_text = ""
-        response_function_calls = []
-        for chunk in response:
-            if chunk.candidates[0].content is None: continue
+        toolDispatcher = ToolDispatcher(handlers)
+        response_function_calls = await call_gemini(client, messages, config, toolDispatcher, contextWindow)
+        utils.save_messages(messages_file_path, messages)
+
+    return messages
+
+
+
+async def call_gemini(client: genai.Client, messages: list, config: types.GenerateContentConfig, toolDispatcher: ToolDispatcher, contextWindow: ContextWindow) -> list:
+    """
+    Stream a model response with the async client and append it to `messages`.
+    Only what `contextWindow` selects from `messages` is sent. Text is printed as it arrives,
+    and every complete function call is handed to `toolDispatcher` so it can be started
+    before the rest of the response has streamed in.
+    """
+    logging.warning("Calling Gemini")
+    startTime = time.time()
+    contents = contextWindow.build(messages)
+    chunks = asyncio.Queue()
+
+    async def produce():
+        try:
+            response = await client.aio.models.generate_content_stream(
+                model="gemini-2.5-flash",
+                contents=contents,
+                config=config,
+            )
+            async for chunk in response:
+                await chunks.put(chunk)
+        finally:
+            await chunks.put(None)
+
+    producer = asyncio.create_task(produce())
+    response_text = ""
+    response_function_calls = []
+    prompt_token_count = None
+    try:
+        while (chunk := await chunks.get()) is not None:
+            if chunk.usage_metadata and chunk.usage_metadata.prompt_token_count:
+                prompt_token_count = chunk.usage_metadata.prompt_token_count
+            if not chunk.candidates or chunk.candidates[0].content is None: continue
             parts = chunk.candidates[0].content.parts
             if parts is None: continue
             for part in parts:
@@ -120,17 +129,22 @@ async def run_agent(user_prompt: str, messages: list, workspace_directory: str)
                     print(part.text, end="")
                 if part.function_call:
                     response_function_calls.append(part.function_call)
-        print()
-        logging.warning(f"Gemini response complete in {time.time() - startTime}")
-        
-        messages.append(types.Content(role="model", parts = [types.Part(text=response_text)] + [types.Part.from_function_call(name=function_call.name, args=function_call.args) for function_call in response_function_calls]))
-        utils.save_messages(messages_file_path, messages)
+                    toolDispatcher.submit(part.function_call)
+        await producer
+    except BaseException:
+        producer.cancel()
+        toolDispatcher.cancel()
+        raise
+    print()
+    logging.warning(f"Gemini response complete in {time.time() - startTime}")
+    contextWindow.observe(contextWindow.last_stats["estimated_tokens"], prompt_token_count)
 
-    return messages
+    messages.append(types.Content(role="model", parts = [types.Part(text=response_text)] + [types.Part.from_function_call(name=function_call.name, args=function_call.args) for function_call in response_function_calls]))
+    return response_function_calls
 
 
 
-async def handle_request_photo_tool(client: genai.Client, mobileTool: mobile.MobileTool, function_name: str,function_args: dict, workspace_directory: str):
+async def handle_request_photo_tool(client: genai.Client, mobileTool: mobile.MobileTool, function_name: str,function_args: dict, workspace_directory: str, mediaPipeline: MediaPipeline):
     logging.warning(f"Function {function_name} called. Args: {function_args}")
     parts = []
     request_photo_tool_result = await mobileTool.request_photo_tool(function_args["instruction"], 60*10)
@@ -147,12 +161,7 @@ async def handle_request_photo_tool(client: genai.Client, mobileTool: mobile.Mob
         ))
         file_url = request_photo_tool_result["file_url"]
         download_directory = os.path.join(workspace_directory, ".actualCodeDownloads")
-        image_file_path = (await utils.download_files([file_url], download_directory))[0]
-        uploaded_file = client.files.upload(file=image_file_path)
-        while uploaded_file.state.name == "PROCESSING":
-            print('.', end='', flush=True)
-            await asyncio.sleep(0.2)
-            uploaded_file = client.files.get(name = uploaded_file.name)
+        uploaded_file, _ = await mediaPipeline.capture(file_url, download_directory)
         print()
 
         if uploaded_file.state.name == "FAILED":
@@ -161,7 +170,7 @@ async def handle_request_photo_tool(client: genai.Client, mobileTool: mobile.Mob
     return parts, [uploaded_file,]
 
 
-async def handle_request_video_tool(client: genai.Client, mobileTool: mobile.MobileTool, function_name: str,function_args: dict, workspace_directory: str):
+async def handle_request_video_tool(client: genai.Client, mobileTool: mobile.MobileTool, function_name: str,function_args: dict, workspace_directory: str, mediaPipeline: MediaPipeline):
     logging.warning(f"Function {function_name} called. Args: {function_args}")
     parts = []
     request_video_tool_result = await mobileTool.request_video_tool(function_args["instruction"], function_args.get("fps", 1), 60*10)
@@ -178,12 +187,7 @@ async def handle_request_video_tool(client: genai.Client, mobileTool: mobile.Mob
         ))
         file_url = request_video_tool_result["file_url"]
         download_directory = os.path.join(workspace_directory, ".actualCodeDownloads")
-        video_file_path = (await utils.download_files([file_url], download_directory))[0]
-        uploaded_file = client.files.upload(file=video_file_path)
-        while uploaded_file.state.name == "PROCESSING":
-            print('.', end='', flush=True)
-            await asyncio.sleep(0.2)
-            uploaded_file = client.files.get(name = uploaded_file.name)
+        uploaded_file, _ = await mediaPipeline.capture(file_url, download_directory)
         print()
 
         if uploaded_file.state.name == "FAILED":
@@ -230,6 +234,25 @@ async def handle_bash_tool(client: genai.Client, bashTool: bash.BashTool, functi
     return parts, []
 
 
+async def handle_bash_job_tool(client: genai.Client, jobTool: jobs.JobTool, function_name: str, function_args: dict, workspace_directory: str):
+    logging.warning(f"Function {function_name} called. Args: {function_args}")
+    parts = []
+    try:
+        result = await jobTool(**function_args)
+    except ToolError as e:
+        parts.append(types.Part.from_function_response(
+            name=function_name,
+            response={"error": e.message},
+        ))
+        return parts, []
+    parts.append(types.Part.from_function_response(
+            name=function_name,
+            response={"result": result["text"]},
+    ))
+    print(f"Job {result['text']}")
+    return parts, []
+
+
 async def handle_search_tool(client: genai.Client, searchTool: search.SearchTool, function_name: str, function_args: dict, workspace_directory: str):
     logging.warning(f"Function {function_name} called. Args: {function_args}")
     parts = []
@@ -250,6 +273,25 @@ async def handle_search_tool(client: genai.Client, searchTool: search.SearchTool
     return parts, []
 
 
+async def handle_workspace_search_tool(client: genai.Client, workspaceSearchTool: workspace_search.WorkspaceSearchTool, function_name: str, function_args: dict, workspace_directory: str):
+    logging.warning(f"Function {function_name} called. Args: {function_args}")
+    parts = []
+    try:
+        result = await workspaceSearchTool(**function_args)
+    except ToolError as e:
+        parts.append(types.Part.from_function_response(
+            name=function_name,
+            response={"error": e.message},
+        ))
+        return parts, []
+    parts.append(types.Part.from_function_response(
+            name=function_name,
+            response={"result": result["text"]},
+    ))
+    logging.warning(f"Workspace search complete.")
+    return parts, []
+
+
 async def handle_web_fetch_tool(client: genai.Client, webFetchTool: web_fetch.WebFetchTool, function_name: str, function_args: dict, workspace_directory: str):
     logging.warning(f"Function {function_name} called. Args: {function_args}")
     parts = []
@@ -290,3 +332,20 @@ async def handle_multimedia_reader_tool(client: genai.Client, multimediaReaderTo
     return parts, result[1]["files"]
 
 
+async def handle_datasheet_query_tool(client: genai.Client, datasheetQueryTool: datasheets.DatasheetQueryTool, function_name: str, function_args: dict, workspace_directory: str):
+    logging.warning(f"Function {function_name} called. Args: {function_args}")
+    parts = []
+    try:
+        result = await datasheetQueryTool(**function_args)
+    except ToolError as e:
+        parts.append(types.Part.from_function_response(
+            name=function_name,
+            response={"error": e.message},
+        ))
+        return parts, []
+    parts.append(types.Part.from_function_response(
+            name=function_name,
+            response={"result": result["text"]},
+    ))
+    logging.warning(f"Datasheet query complete.")
+    return parts, []
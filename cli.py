@@ -1,23 +1,78 @@
 import argparse
 import os
+import sys
 from pathlib import Path
 import asyncio
+import threading
 import utils
 from dotenv import load_dotenv
 from agent_loop import run_agent
+from runtime import AgentRuntime
 load_dotenv()
 
 
+_stdin_pending = b""  # bytes read past the end of the last line
+
+
+def _read_line() -> str:
+    """Read a line straight from the stdin file descriptor (no buffered-reader lock held while waiting)."""
+    global _stdin_pending
+    while b"\n" not in _stdin_pending:
+        chunk = os.read(sys.stdin.fileno(), 4096)
+        if not chunk:
+            if _stdin_pending:
+                break
+            raise EOFError
+        _stdin_pending += chunk
+    line, _, _stdin_pending = _stdin_pending.partition(b"\n")
+    return line.decode(sys.stdin.encoding or "utf-8", errors="replace").rstrip("\r")
+
+
+async def read_input(prompt: str) -> str:
+    """
+    Like input(), but without blocking the event loop, so background jobs and fetches keep running
+    while the user types. The line is read in a daemon thread rather than the default executor,
+    which would keep the process alive at exit (e.g. after Ctrl-C) until a line is entered.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(result, exception):
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def read():
+        try:
+            line = _read_line()
+        except BaseException as e:
+            loop.call_soon_threadsafe(deliver, None, e)
+        else:
+            loop.call_soon_threadsafe(deliver, line, None)
+
+    print(prompt, end="", flush=True)
+    threading.Thread(target=read, daemon=True).start()
+    return await future
+
+
 async def main(workspace_directory: str):
     messages_file_path = os.path.join(workspace_directory, ".actualCodeMessagesData")
     messages = utils.load_messages(messages_file_path)
+    runtime = AgentRuntime(workspace_directory)
+    await runtime.start()
 
-    while True:
-        if len(messages) == 0:
-            user_prompt = input("What do you want to build?: \n")
-        else:
-            user_prompt = input("Prompt: ")
-        messages = await run_agent(user_prompt, messages, workspace_directory)
+    try:
+        while True:
+            if len(messages) == 0:
+                user_prompt = await read_input("What do you want to build?: \n")
+            else:
+                user_prompt = await read_input("Prompt: ")
+            messages = await run_agent(user_prompt, messages, runtime)
+    finally:
+        await runtime.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,202 @@
+import os
+import json
+import logging
+
+from google.genai import types
+
+# Rough per-file costs, in tokens, for uploaded media the estimator can't see into.
+FILE_TOKENS = {"image": 258, "video": 20000, "audio": 4000, "application/pdf": 8000}
+DEFAULT_FILE_TOKENS = 2000
+CHARS_PER_TOKEN = 4
+SUMMARY_CHARS = 300
+
+
+class ContextWindow:
+    """
+    Decides what part of the conversation is sent to Gemini on each call.
+
+    `messages` keeps the full history (it's what gets journaled); `build` returns a view of it
+    that fits in `token_budget`. Token counts are estimated once per entry and cached, then
+    scaled by what the API actually reports. When over budget, tool outputs, large call
+    arguments and uploaded files in old turns are collapsed into short summaries first; if
+    that's not enough, whole old turns are dropped. The system prompt, the last
+    `keep_recent_turns` turns and pinned entries are always sent as they are.
+    """
+
+    def __init__(self, token_budget: int | None = None, keep_recent_turns: int = 6, system_entries: int = 2):
+        if token_budget is None:
+            token_budget = int(os.environ.get("ACTUALCODE_TOKEN_BUDGET", 200_000))
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.system_entries = system_entries
+        self.scale = 1.0  # actual / estimated tokens, learned from usage metadata
+        self.last_stats = {}
+        self.total_saved_tokens = 0
+        self._tokens = {}  # id(entry) -> (entry, estimated tokens)
+        self._collapsed = {}  # id(entry) -> (entry, collapsed entry, estimated tokens)
+        self._pinned = set()
+        self._verbatim = set()  # ids of the entries the last build sent unchanged
+
+    def pin(self, entry) -> None:
+        """Always send `entry` (and the turn it belongs to) verbatim."""
+        self._pinned.add(id(entry))
+
+    def sent_verbatim(self, entry) -> bool:
+        """Whether the last `build` sent `entry` as it is, i.e. it wasn't collapsed or dropped."""
+        return id(entry) in self._verbatim
+
+    def tokens(self, entry) -> int:
+        cached = self._tokens.get(id(entry))
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        tokens = _estimate_tokens(entry)
+        self._tokens[id(entry)] = (entry, tokens)
+        return tokens
+
+    def observe(self, estimated_tokens: int, prompt_token_count: int | None) -> None:
+        """Calibrate the estimator against the prompt token count the API reported."""
+        if not prompt_token_count or estimated_tokens <= 0:
+            return
+        ratio = prompt_token_count / estimated_tokens
+        self.scale = 0.7 * self.scale + 0.3 * ratio
+
+    def build(self, messages: list) -> list:
+        """Return the entries to send, fitted to the token budget."""
+        entries = [entry for entry in messages if entry is not None]
+        system, turns = entries[:self.system_entries], _split_turns(entries[self.system_entries:])
+        budget = self.token_budget / self.scale
+
+        turn_tokens = [sum(self.tokens(entry) for entry in turn) for turn in turns]
+        system_tokens = sum(self.tokens(entry) for entry in system)
+        original_tokens = system_tokens + sum(turn_tokens)
+        total = original_tokens
+
+        protected = [
+            index >= len(turns) - self.keep_recent_turns or any(id(entry) in self._pinned for entry in turn)
+            for index, turn in enumerate(turns)
+        ]
+        collapsed = 0
+        dropped = 0
+        for index, turn in enumerate(turns):
+            if total <= budget: break
+            if protected[index]: continue
+            new_turn = [self._collapse(entry) for entry in turn]
+            new_tokens = sum(self._collapsed_tokens(entry) for entry in turn)
+            total -= turn_tokens[index] - new_tokens
+            turns[index], turn_tokens[index] = new_turn, new_tokens
+            collapsed += 1
+        for index, turn in enumerate(turns):
+            if total <= budget: break
+            if protected[index] or turn is None: continue
+            total -= turn_tokens[index]
+            turns[index] = None
+            dropped += 1
+
+        contents = list(system)
+        if dropped:
+            contents.append(types.Content(role="user", parts=[types.Part(text=f"[{dropped} earlier turns were removed to fit the context window.]")]))
+        for turn in turns:
+            if turn is not None:
+                contents += turn
+
+        self._verbatim = {id(entry) for entry in contents}
+        saved = original_tokens - total
+        self.total_saved_tokens += saved
+        self.last_stats = {
+            "original_tokens": round(original_tokens * self.scale),
+            "sent_tokens": round(total * self.scale),
+            "saved_tokens": round(saved * self.scale),
+            "collapsed_turns": collapsed,
+            "dropped_turns": dropped,
+            "estimated_tokens": total,
+        }
+        if saved:
+            logging.warning(f"Context window: sending ~{self.last_stats['sent_tokens']} of ~{self.last_stats['original_tokens']} tokens ({collapsed} turns collapsed, {dropped} dropped)")
+        self._forget(entries)
+        return contents
+
+    def _collapse(self, entry):
+        cached = self._collapsed.get(id(entry))
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        collapsed = _collapse_entry(entry)
+        self._collapsed[id(entry)] = (entry, collapsed, _estimate_tokens(collapsed))
+        return collapsed
+
+    def _collapsed_tokens(self, entry) -> int:
+        self._collapse(entry)
+        return self._collapsed[id(entry)][2]
+
+    def _forget(self, entries: list) -> None:
+        """Drop cache entries for objects that are no longer in the history."""
+        if len(self._tokens) <= 2 * len(entries):
+            return
+        live = {id(entry) for entry in entries}
+        self._tokens = {key: value for key, value in self._tokens.items() if key in live}
+        self._collapsed = {key: value for key, value in self._collapsed.items() if key in live}
+
+
+def _split_turns(entries: list) -> list[list]:
+    """Group entries so every turn starts with a model message and carries the replies to its calls."""
+    turns = []
+    for entry in entries:
+        if not turns or (isinstance(entry, types.Content) and entry.role == "model"):
+            turns.append([])
+        turns[-1].append(entry)
+    return turns
+
+
+def _estimate_tokens(entry) -> int:
+    if isinstance(entry, types.File):
+        return _file_tokens(entry.mime_type)
+    if not isinstance(entry, types.Content):
+        return DEFAULT_FILE_TOKENS
+    chars = 0
+    tokens = 0
+    for part in entry.parts or []:
+        if part.text:
+            chars += len(part.text)
+        if part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+        if part.function_response:
+            chars += len(json.dumps(part.function_response.response or {}, default=str))
+        if part.file_data:
+            tokens += _file_tokens(part.file_data.mime_type)
+        if part.inline_data:
+            tokens += _file_tokens(part.inline_data.mime_type)
+    return tokens + chars // CHARS_PER_TOKEN + 1
+
+
+def _file_tokens(mime_type: str | None) -> int:
+    mime_type = mime_type or ""
+    return FILE_TOKENS.get(mime_type, FILE_TOKENS.get(mime_type.split("/")[0], DEFAULT_FILE_TOKENS))
+
+
+def _summarize(value) -> str:
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(text) <= SUMMARY_CHARS:
+        return text
+    return f"{text[:SUMMARY_CHARS]}... [collapsed {len(text) - SUMMARY_CHARS} more characters of earlier output]"
+
+
+def _collapse_entry(entry):
+    """Return a smaller copy of `entry` with bulky tool payloads summarized. The original isn't modified."""
+    if isinstance(entry, types.File):
+        return types.Content(role="user", parts=[types.Part(text=f"[Earlier uploaded file {entry.display_name or entry.name} ({entry.mime_type}) was removed from the context.]")])
+    if not isinstance(entry, types.Content):
+        return entry
+    parts = []
+    for part in entry.parts or []:
+        if part.function_response:
+            response = {key: _summarize(value) for key, value in (part.function_response.response or {}).items()}
+            parts.append(types.Part.from_function_response(name=part.function_response.name, response=response))
+        elif part.function_call:
+            args = {key: _summarize(value) if isinstance(value, str) else value for key, value in (part.function_call.args or {}).items()}
+            parts.append(types.Part.from_function_call(name=part.function_call.name, args=args))
+        elif part.text and entry.role == "user" and len(part.text) > SUMMARY_CHARS:
+            parts.append(types.Part(text=_summarize(part.text)))
+        elif part.file_data or part.inline_data:
+            parts.append(types.Part(text="[Earlier file was removed from the context.]"))
+        else:
+            parts.append(part)
+    return types.Content(role=entry.role, parts=parts)
@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from google.genai import types
+
+from tools.bash import is_stateful
+
+# Tools that only read state. Anything else is treated as side-effecting.
+READ_ONLY_TOOLS = {"search_tool", "workspace_search_tool", "web_fetch_tool", "multimedia_reader_tool", "datasheet_query_tool"}
+READ_ONLY_COMMANDS = {"text_editor_tool": {"view"}, "bash_job_tool": {"poll", "tail", "list"}}
+# Side-effecting tools that don't touch what the other tools read, so several can run at once.
+INDEPENDENT_TOOLS = {"request_photo_tool", "request_video_tool"}
+
+
+def is_read_only(function_call: types.FunctionCall) -> bool:
+    if function_call.name in READ_ONLY_TOOLS:
+        return True
+    commands = READ_ONLY_COMMANDS.get(function_call.name)
+    args = function_call.args or {}
+    return commands is not None and (args.get("command") in commands or args.get("operation") in commands)
+
+
+def concurrency_group(function_call: types.FunctionCall) -> str | None:
+    """Consecutive deferred calls in the same group run concurrently; None means the call runs on its own."""
+    if is_read_only(function_call):
+        return "read"
+    if function_call.name in INDEPENDENT_TOOLS:
+        return "independent"
+    args = function_call.args or {}
+    if function_call.name == "bash_tool" and args.get("command") and not args.get("restart") and not is_stateful(args["command"]):
+        # BashTool runs these on separate shells that all start from the primary's state
+        return "bash"
+    return None
+
+
+class ToolDispatcher:
+    """
+    Starts tool calls while the model response is still streaming.
+
+    Read-only calls start as soon as they arrive. Side-effecting calls (bash, file edits,
+    phone requests) wait for the stream to finish unless `speculative_side_effects` is set,
+    and once one has been deferred every later call is deferred too. Deferred calls then run
+    in phases: each write runs alone, after everything before it has finished, while runs of
+    consecutive reads (or of phone requests, or of bash commands that don't change the shell's
+    state) run together, so a read never runs ahead of a write the model asked for before it.
+    With `speculative_side_effects` writes start as they arrive and that ordering isn't
+    guaranteed. Results always come back in call order.
+    """
+
+    def __init__(self, handlers: dict[str, Callable[[str, dict], Awaitable]], speculative_side_effects: bool | None = None):
+        self.handlers = handlers
+        if speculative_side_effects is None:
+            speculative_side_effects = os.environ.get("ACTUALCODE_SPECULATIVE_SIDE_EFFECTS", "") == "1"
+        self.speculative_side_effects = speculative_side_effects
+        self._calls = []  # (function_call, task or None)
+        self._deferring = False
+        self._startTime = time.time()
+        self._first_result_time = None
+
+    def submit(self, function_call: types.FunctionCall) -> None:
+        """Called for every function call as soon as its chunk arrives."""
+        if function_call.name not in self.handlers:
+            raise ValueError(f"Function {function_call.name} not found!")
+        if not self._deferring and (self.speculative_side_effects or is_read_only(function_call)):
+            logging.warning(f"Dispatching {function_call.name} while the response is streaming")
+            self._calls.append((function_call, self._start(function_call)))
+        else:
+            self._deferring = True
+            self._calls.append((function_call, None))
+
+    def _start(self, function_call: types.FunctionCall, after: list[asyncio.Task] = ()) -> asyncio.Task:
+        task = asyncio.create_task(self._run(function_call, after))
+        task.add_done_callback(self._on_done)
+        return task
+
+    async def _run(self, function_call: types.FunctionCall, after: list[asyncio.Task]):
+        if after:
+            # Failures are reported by the calls themselves; only their completion matters here
+            await asyncio.gather(*after, return_exceptions=True)
+        return await self.handlers[function_call.name](function_call.name, function_call.args)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        if self._first_result_time is None and not task.cancelled():
+            self._first_result_time = time.time()
+            logging.warning(f"First tool result after {self._first_result_time - self._startTime}")
+
+    async def results(self) -> list:
+        """Start any deferred calls, phase by phase, and return all results in call order."""
+        tasks = []
+        previous_phase = []  # the tasks the current phase waits for
+        phase = []  # calls already running count as the first phase
+        phase_group = None
+        for index, (function_call, task) in enumerate(self._calls):
+            if task is None:
+                group = concurrency_group(function_call)
+                if group is None or group != phase_group:
+                    previous_phase, phase, phase_group = phase or previous_phase, [], group
+                task = self._start(function_call, after=previous_phase)
+                self._calls[index] = (function_call, task)
+            phase.append(task)
+            tasks.append(task)
+        return await asyncio.gather(*tasks)
+
+    def cancel(self) -> None:
+        """Cancel calls that were started speculatively, e.g. when the stream failed."""
+        for _, task in self._calls:
+            if task is not None and not task.done():
+                task.cancel()
@@ -0,0 +1,294 @@
+import io
+import os
+import re
+import ssl
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import contextlib
+from typing import Callable
+from urllib.parse import urlparse, unquote
+
+import aiohttp
+import certifi
+
+CHUNK_SIZE = 1024 * 1024  # bytes per disk write
+MAX_CONCURRENT_DOWNLOADS = 4
+MAX_ATTEMPTS = 3  # an interrupted download is resumed with a range request up to this many times
+READ_TIMEOUT = 60.0  # seconds without receiving any data
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadTooLarge(DownloadError):
+    """Raised by `DownloadManager.fetch` for content over its `max_bytes`."""
+
+
+class DownloadProgress:
+    """How far a download has got, for progress display and throughput stats."""
+
+    def __init__(self, url: str, path: str):
+        self.url = url
+        self.path = path
+        self.bytes_done = 0
+        self.total_bytes = None  # unknown until the server says
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.attempts = 0
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second so far."""
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def fraction(self) -> float | None:
+        return self.bytes_done / self.total_bytes if self.total_bytes else None
+
+    def __str__(self) -> str:
+        total = f"/{self.total_bytes / 1e6:.1f}" if self.total_bytes else ""
+        return f"{os.path.basename(self.path)}: {self.bytes_done / 1e6:.1f}{total} MB at {self.throughput / 1e6:.1f} MB/s"
+
+
+class DownloadManager:
+    """
+    Downloads files over a pooled keep-alive session (the runtime's, once it's started). Bodies are
+    streamed to disk in CHUNK_SIZE writes and hashed on the way; a dropped connection is resumed with
+    a Range request instead of starting over. Files never overwrite each other: a second `photo.jpg`
+    in the same folder is saved as `photo-1.jpg`.
+    """
+
+    def __init__(self, http_session: aiohttp.ClientSession | None = None, chunk_size: int = CHUNK_SIZE, max_concurrent: int = MAX_CONCURRENT_DOWNLOADS):
+        self.http_session = http_session
+        self.chunk_size = chunk_size
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.active: set[DownloadProgress] = set()  # downloads in flight
+        self.bytes_downloaded = 0
+        self.seconds_downloading = 0.0
+
+    @contextlib.asynccontextmanager
+    async def _session(self):
+        """Yield the shared session if there is one, otherwise a throwaway one."""
+        if self.http_session is not None:
+            yield self.http_session
+            return
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
+            yield session
+
+    def stats(self) -> dict:
+        """Totals over finished downloads, plus the progress of those in flight."""
+        return {
+            "bytes": self.bytes_downloaded,
+            "seconds": round(self.seconds_downloading, 3),
+            "throughput": self.bytes_downloaded / self.seconds_downloading if self.seconds_downloading else 0.0,
+            "active": [str(progress) for progress in self.active],
+        }
+
+    async def download(
+        self,
+        url: str,
+        folder: str,
+        sha256: str | None = None,
+        on_progress: Callable[[DownloadProgress], None] | None = None,
+        session: aiohttp.ClientSession | None = None,
+    ) -> str:
+        """
+        Download `url` into `folder` and return the saved file's path. If `sha256` is given (or the
+        server sends a sha-256 Digest header), the file is checked against it. Raises DownloadError.
+        """
+        if session is None:
+            async with self._session() as session:
+                return await self.download(url, folder, sha256, on_progress, session)
+
+        os.makedirs(folder, exist_ok=True)
+        async with self.semaphore:
+            dest_path = _reserve_path(folder, filename_from_url(url))
+            part_path = dest_path + ".part"
+            progress = DownloadProgress(url, dest_path)
+            self.active.add(progress)
+            try:
+                with open(part_path, "wb") as f:
+                    digest = await self._fetch(session, url, f, progress, on_progress)
+                _verify(url, sha256, digest)
+                os.replace(part_path, dest_path)
+            except BaseException:
+                for path in (part_path, dest_path):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                raise
+            finally:
+                progress.finished_at = time.monotonic()
+                self.active.discard(progress)
+
+        self.bytes_downloaded += progress.bytes_done
+        self.seconds_downloading += progress.elapsed
+        logging.warning(f"Downloaded {url} → {dest_path} ({progress})")
+        return dest_path
+
+    async def fetch(
+        self,
+        url: str,
+        sha256: str | None = None,
+        max_bytes: int | None = None,
+        on_progress: Callable[[DownloadProgress], None] | None = None,
+        session: aiohttp.ClientSession | None = None,
+    ) -> tuple[memoryview, str | None, str]:
+        """
+        Download `url` into memory and return (content, content type, sha256), with the same resuming
+        and checksum verification as `download`. The content is a view of the download buffer, not a
+        copy. Raises DownloadTooLarge as soon as the content is known to exceed `max_bytes`.
+        """
+        if session is None:
+            async with self._session() as session:
+                return await self.fetch(url, sha256, max_bytes, on_progress, session)
+
+        async with self.semaphore:
+            buffer = io.BytesIO()
+            progress = DownloadProgress(url, filename_from_url(url))
+            self.active.add(progress)
+            try:
+                digest = await self._fetch(session, url, buffer, progress, on_progress, max_bytes)
+                _verify(url, sha256, digest)
+            finally:
+                progress.finished_at = time.monotonic()
+                self.active.discard(progress)
+
+        self.bytes_downloaded += progress.bytes_done
+        self.seconds_downloading += progress.elapsed
+        logging.warning(f"Fetched {url} into memory ({progress})")
+        return buffer.getbuffer(), digest["content_type"], digest["actual"]
+
+    async def save(self, url: str, folder: str, content: bytes | memoryview) -> str:
+        """Write content got with `fetch` into `folder`, named after `url` like `download` would, and return the path."""
+
+        def write() -> str:
+            os.makedirs(folder, exist_ok=True)
+            path = _reserve_path(folder, filename_from_url(url))
+            with open(path, "wb") as f:
+                f.write(content)
+            return path
+
+        return await asyncio.to_thread(write)
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str, f, progress: DownloadProgress, on_progress, max_bytes: int | None = None) -> dict:
+        """Stream `url` into the file object `f`, resuming after dropped connections. Returns the expected and actual sha256."""
+        sha = hashlib.sha256()
+        expected = None
+        content_type = None
+        validator = None  # ETag or Last-Modified of the first response, so a resume can't mix two versions
+        while True:
+            progress.attempts += 1
+            headers = {}
+            if progress.bytes_done:
+                headers["Range"] = f"bytes={progress.bytes_done}-"
+                if validator:
+                    headers["If-Range"] = validator
+            try:
+                async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=None, sock_read=READ_TIMEOUT)) as response:
+                    if response.status == 206:
+                        start, total = _content_range(response.headers.get("Content-Range", ""))
+                        if start != progress.bytes_done:
+                            raise DownloadError(f"server resumed {url} at byte {start} instead of {progress.bytes_done}")
+                    elif response.status == 200:
+                        if progress.bytes_done:
+                            # Range ignored or the file changed: start over
+                            logging.warning(f"Restarting download of {url} from the beginning")
+                            f.seek(0)
+                            f.truncate()
+                            sha = hashlib.sha256()
+                            progress.bytes_done = 0
+                        total = response.content_length
+                        expected = _digest_sha256(response.headers)
+                        content_type = response.headers.get("Content-Type")
+                    else:
+                        response.raise_for_status()
+                        raise DownloadError(f"unexpected HTTP {response.status} for {url}")
+                    validator = validator or response.headers.get("ETag") or response.headers.get("Last-Modified")
+                    progress.total_bytes = total
+                    if max_bytes is not None and (total or 0) > max_bytes:
+                        raise DownloadTooLarge(f"{url} is {total} bytes, over the {max_bytes} byte limit")
+
+                    buffer = bytearray()
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        buffer += chunk
+                        if max_bytes is not None and progress.bytes_done + len(buffer) > max_bytes:
+                            raise DownloadTooLarge(f"{url} is over the {max_bytes} byte limit")
+                        if len(buffer) >= self.chunk_size:
+                            await self._write(f, sha, buffer, progress, on_progress)
+                            buffer = bytearray()
+                    if buffer:
+                        await self._write(f, sha, buffer, progress, on_progress)
+            except (aiohttp.ClientPayloadError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if progress.attempts >= MAX_ATTEMPTS:
+                    raise DownloadError(f"{url} failed after {progress.attempts} attempts: {e or type(e).__name__}") from None
+                logging.warning(f"Download of {url} interrupted at {progress.bytes_done} bytes ({e or type(e).__name__}), resuming")
+                continue
+
+            if progress.total_bytes is not None and progress.bytes_done != progress.total_bytes:
+                if progress.attempts >= MAX_ATTEMPTS:
+                    raise DownloadError(f"{url} ended after {progress.bytes_done} of {progress.total_bytes} bytes")
+                continue
+            return {"expected": expected, "actual": sha.hexdigest(), "content_type": content_type}
+
+    async def _write(self, f, sha, data: bytearray, progress: DownloadProgress, on_progress) -> None:
+        sha.update(data)
+        if isinstance(f, io.BytesIO):
+            f.write(data)
+        else:
+            await asyncio.to_thread(f.write, data)
+        progress.bytes_done += len(data)
+        if on_progress is not None:
+            on_progress(progress)
+
+
+def _verify(url: str, sha256: str | None, digest: dict) -> None:
+    expected = (sha256 or digest["expected"] or "").lower()
+    if expected and digest["actual"] != expected:
+        raise DownloadError(f"checksum mismatch for {url}: expected sha256 {expected}, got {digest['actual']}")
+
+
+def filename_from_url(url: str) -> str:
+    filename = os.path.basename(unquote(urlparse(url).path))
+    filename = re.sub(r"[^\w.\- ]", "_", filename).strip(". ")
+    return filename or "downloaded_file"
+
+
+def _reserve_path(folder: str, filename: str) -> str:
+    """Create an empty file at a path nothing else has taken yet (photo.jpg, photo-1.jpg, ...) and return it."""
+    stem, suffix = os.path.splitext(filename)
+    for n in range(10_000):
+        path = os.path.join(folder, filename if n == 0 else f"{stem}-{n}{suffix}")
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return path
+        except FileExistsError:
+            continue
+    raise DownloadError(f"too many files named like {filename} in {folder}")
+
+
+def _content_range(value: str) -> tuple[int, int | None]:
+    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", value)
+    if match is None:
+        raise DownloadError(f"invalid Content-Range {value!r}")
+    return int(match.group(1)), None if match.group(2) == "*" else int(match.group(2))
+
+
+def _digest_sha256(headers) -> str | None:
+    """The sha256 from a `Digest: sha-256=<base64>` header, as hex."""
+    for item in headers.get("Digest", "").split(","):
+        algorithm, _, value = item.strip().partition("=")
+        if algorithm.lower() == "sha-256" and value:
+            try:
+                return base64.b64decode(value).hex()
+            except ValueError:
+                return None
+    return None
@@ -0,0 +1,213 @@
+import os
+import mmap
+import time
+import zlib
+import struct
+import pickle
+import logging
+
+
+class MessageJournal:
+    """Append-only, length-prefixed log of conversation entries.
+
+    Every record is `<length><crc32>` followed by a payload whose first byte is the
+    record kind: `E` (a pickled entry) or `T` (truncate the replayed list to N entries).
+    Only new entries are written on each save; a truncated or corrupt tail left by a
+    crash is cut off on load.
+    """
+
+    MAGIC = b"ACJOURNAL1\n"
+    _header = struct.Struct("<II")
+    _truncate = struct.Struct("<I")
+
+    def __init__(self, file_path: str, fsync_every: int = 8, fsync_interval: float = 5.0, compact_min_bytes: int = 1024 * 1024):
+        self.file_path = file_path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_min_bytes = compact_min_bytes
+        self._file = None
+        self._entries = []  # references to the journaled objects, used to detect rewritten history
+        self._sizes = []  # on-disk size of each live entry's record
+        self._live_bytes = 0
+        self._dead_bytes = 0
+        self._pending = 0
+        self._last_fsync = time.time()
+        self._loaded = False
+
+    def load(self) -> list:
+        """Replay the journal and return the entries. Converts legacy pickle files in place."""
+        self._entries = []
+        self._sizes = []
+        self._live_bytes = 0
+        self._dead_bytes = 0
+        self._loaded = True
+        if not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0:
+            return []
+
+        with open(self.file_path, "rb") as f:
+            if f.read(len(self.MAGIC)) != self.MAGIC:
+                f.seek(0)
+                entries = pickle.load(f)
+                logging.warning(f"converting legacy message file {self.file_path} to journal")
+                self.compact(entries)
+                return list(entries)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                good_offset = self._replay(data)
+                file_size = len(data)
+
+        if good_offset < file_size:
+            logging.warning(f"journal {self.file_path} has a truncated tail ({file_size - good_offset} bytes), recovering")
+            self.compact(self._entries)
+        elif self._should_compact():
+            self.compact(self._entries)
+        return list(self._entries)
+
+    def _replay(self, data) -> int:
+        """Apply records from `data` to `self._entries` and return the offset after the last valid record."""
+        view = memoryview(data)
+        offset = len(self.MAGIC)
+        try:
+            while offset + self._header.size <= len(data):
+                length, crc = self._header.unpack_from(data, offset)
+                start = offset + self._header.size
+                end = start + length
+                if length == 0 or end > len(data) or zlib.crc32(view[start:end]) != crc:
+                    break
+                kind = data[start:start + 1]
+                record_size = end - offset
+                if kind == b"E":
+                    try:
+                        entry = pickle.loads(view[start + 1:end])
+                    except Exception:
+                        break
+                    self._entries.append(entry)
+                    self._sizes.append(record_size)
+                    self._live_bytes += record_size
+                elif kind == b"T":
+                    (count,) = self._truncate.unpack_from(data, start + 1)
+                    removed = sum(self._sizes[count:])
+                    del self._entries[count:]
+                    del self._sizes[count:]
+                    self._live_bytes -= removed
+                    self._dead_bytes += removed + record_size
+                else:
+                    break
+                offset = end
+        finally:
+            view.release()
+        return offset
+
+    def save(self, messages: list) -> None:
+        """Persist `messages`, writing only what changed since the last save."""
+        if not self._loaded and os.path.exists(self.file_path):
+            # Nothing is known about what's on disk, so start over from `messages`.
+            self.compact(messages)
+            return
+        # Find the first entry that differs from what's already journaled. Identity checks
+        # are cheap compared to pickling, and catch history that was rewritten in place.
+        common = min(len(messages), len(self._entries))
+        keep = 0
+        while keep < common and messages[keep] is self._entries[keep]:
+            keep += 1
+
+        if keep < len(self._entries):
+            self._append_truncate(keep)
+        for entry in messages[keep:]:
+            self._append_entry(entry)
+        if self._file is not None:
+            self._file.flush()
+
+        if self._should_compact():
+            self.compact(messages)
+        else:
+            self._maybe_fsync()
+
+    def _open(self):
+        if self._file is None:
+            new_file = not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0
+            self._file = open(self.file_path, "ab")
+            if new_file:
+                self._file.write(self.MAGIC)
+        return self._file
+
+    def _write_record(self, payload: bytes) -> int:
+        f = self._open()
+        f.write(self._header.pack(len(payload), zlib.crc32(payload)))
+        f.write(payload)
+        self._pending += 1
+        return self._header.size + len(payload)
+
+    def _append_entry(self, entry) -> None:
+        record_size = self._write_record(b"E" + pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        self._entries.append(entry)
+        self._sizes.append(record_size)
+        self._live_bytes += record_size
+
+    def _append_truncate(self, count: int) -> None:
+        removed = sum(self._sizes[count:])
+        del self._entries[count:]
+        del self._sizes[count:]
+        self._live_bytes -= removed
+        self._dead_bytes += removed + self._write_record(b"T" + self._truncate.pack(count))
+
+    def _should_compact(self) -> bool:
+        return self._dead_bytes >= self.compact_min_bytes and self._dead_bytes > self._live_bytes
+
+    def _maybe_fsync(self) -> None:
+        if self._pending == 0:
+            return
+        if self._pending >= self.fsync_every or time.time() - self._last_fsync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        """Flush and fsync any pending records."""
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_fsync = time.time()
+
+    def compact(self, messages: list) -> None:
+        """Rewrite the journal with only the live entries, atomically."""
+        startTime = time.time()
+        self.close()
+        tmp_path = self.file_path + ".tmp"
+        sizes = []
+        with open(tmp_path, "wb") as f:
+            f.write(self.MAGIC)
+            for entry in messages:
+                payload = b"E" + pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(self._header.pack(len(payload), zlib.crc32(payload)))
+                f.write(payload)
+                sizes.append(self._header.size + len(payload))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+        _fsync_directory(os.path.dirname(os.path.abspath(self.file_path)))
+        self._entries = list(messages)
+        self._sizes = sizes
+        self._live_bytes = sum(sizes)
+        self._dead_bytes = 0
+        self._loaded = True
+        logging.warning(f"compacting journal {self.file_path} took {time.time() - startTime}")
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.sync()
+        self._file.close()
+        self._file = None
+
+
+def _fsync_directory(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,131 @@
+"""
+A local stand-in for the ActualCode notification API, for trying out request_photo_tool and
+request_video_tool without the phone app. Start it and point the client at it:
+
+    python mobile_stub_server.py --file circuit.jpg --delay 5
+    ACTUALCODE_API_URL=http://127.0.0.1:8700 python cli.py -d {workspace_directory}
+
+Every notification completes `--delay` seconds after it's sent, with `--file` served as the uploaded
+capture. Without `--delay`, complete it by hand:
+
+    curl -d notification_id=1 [-d file_url=...] [-d status=rejected] http://127.0.0.1:8700/complete_notification
+
+`--no-events` and `--no-long-poll` turn off the event stream and long-polling, to exercise the client's fallbacks.
+"""
+import os
+import json
+import asyncio
+import argparse
+import itertools
+
+from aiohttp import web
+
+KEEPALIVE_SECONDS = 15
+MAX_LONG_POLL_SECONDS = 30
+
+
+class Notification:
+    def __init__(self, notification_id: str, notification_type: str, instruction: str):
+        self.notification_id = notification_id
+        self.notification_type = notification_type
+        self.instruction = instruction
+        self.status = {"notification_status": "waiting"}
+        self.changed = asyncio.Event()
+
+    def complete(self, status: str, file_url: str | None) -> None:
+        self.status = {"notification_status": status}
+        if status == "done":
+            self.status["data"] = {"file_url": file_url}
+        self.changed.set()
+
+
+class StubServer:
+    def __init__(self, args):
+        self.args = args
+        self.notifications = {}
+        self.ids = itertools.count(1)
+
+    def base_url(self, request: web.Request) -> str:
+        return f"{request.scheme}://{request.host}"
+
+    def default_file_url(self, request: web.Request) -> str | None:
+        if not self.args.file:
+            return None
+        return f"{self.base_url(request)}/files/{os.path.basename(self.args.file)}"
+
+    async def send_notification(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        notification = Notification(str(next(self.ids)), form.get("notification_type", "image"), form.get("instruction", ""))
+        self.notifications[notification.notification_id] = notification
+        print(f"[{notification.notification_id}] {notification.notification_type} requested: {notification.instruction}")
+        if self.args.delay is not None:
+            file_url = self.default_file_url(request)
+            asyncio.get_running_loop().call_later(self.args.delay, notification.complete, "done" if file_url else "failed", file_url)
+        return web.json_response({"notification_id": notification.notification_id})
+
+    async def fetch_notification_status(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        notification = self.notifications.get(form.get("notification_id"))
+        if notification is None:
+            return web.json_response({"notification_status": "not_found"})
+        wait = 0 if self.args.no_long_poll else min(float(form.get("wait") or 0), MAX_LONG_POLL_SECONDS)
+        if wait and not notification.changed.is_set():
+            try:
+                await asyncio.wait_for(notification.changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        return web.json_response(notification.status)
+
+    async def notification_events(self, request: web.Request) -> web.StreamResponse:
+        if self.args.no_events:
+            raise web.HTTPNotFound()
+        if not request.headers.get("Authorization", "").startswith("Bearer "):
+            raise web.HTTPUnauthorized()
+        notification = self.notifications.get(request.query.get("notification_id"))
+        if notification is None:
+            raise web.HTTPNotFound()
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        await response.write(f"data: {json.dumps(notification.status)}\n\n".encode())
+        while not notification.changed.is_set():
+            try:
+                await asyncio.wait_for(notification.changed.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await response.write(b": keep-alive\n\n")
+        await response.write(f"data: {json.dumps(notification.status)}\n\n".encode())
+        await response.write_eof()
+        return response
+
+    async def complete_notification(self, request: web.Request) -> web.Response:
+        form = await request.post()
+        notification = self.notifications.get(form.get("notification_id"))
+        if notification is None:
+            raise web.HTTPNotFound()
+        notification.complete(form.get("status", "done"), form.get("file_url") or self.default_file_url(request))
+        return web.json_response(notification.status)
+
+    async def file(self, request: web.Request) -> web.FileResponse:
+        if not self.args.file or request.match_info["name"] != os.path.basename(self.args.file):
+            raise web.HTTPNotFound()
+        return web.FileResponse(self.args.file)  # supports Range requests, for resumed downloads
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/send_notification", self.send_notification)
+        app.router.add_post("/fetch_notification_status", self.fetch_notification_status)
+        app.router.add_get("/notification_events", self.notification_events)
+        app.router.add_post("/complete_notification", self.complete_notification)
+        app.router.add_get("/files/{name}", self.file)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--file", help="Photo or video to hand back as the capture.")
+    parser.add_argument("--delay", type=float, help="Complete every notification after this many seconds.")
+    parser.add_argument("--no-events", action="store_true", help="Don't offer the event stream.")
+    parser.add_argument("--no-long-poll", action="store_true", help="Answer status requests immediately.")
+    args = parser.parse_args()
+    web.run_app(StubServer(args).app(), host=args.host, port=args.port)
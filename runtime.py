@@ -0,0 +1,88 @@
+import os
+import ssl
+import asyncio
+import logging
+
+import aiohttp
+import certifi
+from google import genai
+from google.genai import types
+
+from context_window import ContextWindow
+from downloads import DownloadManager
+from workspace_index import WorkspaceIndex
+from tools import mobile, edit, bash, jobs, search, web_fetch, multimedia_reader, workspace_search, datasheets
+from tools.upload_cache import UploadCache
+from tools.media_pipeline import MediaPipeline
+
+
+class AgentRuntime:
+    """
+    Everything run_agent needs that should outlive a single prompt: the Gemini client,
+    a pooled HTTP session, the tools (with the warm bash shell and the editor's history),
+    the generation config and the context window. Created once per workspace in cli.main.
+    """
+
+    def __init__(self, workspace_directory: str):
+        self.workspace_directory = workspace_directory
+        self.messages_file_path = os.path.join(workspace_directory, ".actualCodeMessagesData")
+        self.client = genai.Client()
+        self.http_session = None
+        self.contextWindow = ContextWindow()
+        self.workspaceIndex = WorkspaceIndex(workspace_directory)
+        self.workspace_entries = []  # the last message that carried the full workspace tree, then those carrying changes since
+        self.uploadCache = UploadCache(workspace_directory, self.client)
+        self.mobileTool = mobile.MobileTool()
+        self.downloadManager = DownloadManager()
+        self.mediaPipeline = MediaPipeline(self.downloadManager, self.uploadCache)
+        self.editTool = edit.EditTool(workspace_directory)
+        self.bashTool = bash.BashTool(workspace_directory)
+        self.jobTool = jobs.JobTool(workspace_directory)
+        self.requestSemaphore = asyncio.Semaphore(search.MAX_CONCURRENT_REQUESTS)  # shared by the tools that call Gemini themselves
+        self.searchTool = search.SearchTool(workspace_directory, self.client, request_semaphore=self.requestSemaphore)
+        self.workspaceSearchTool = workspace_search.WorkspaceSearchTool(workspace_directory)
+        self.webFetchTool = web_fetch.WebFetchTool(workspace_directory, self.client, request_semaphore=self.requestSemaphore)
+        self.multimediaReaderTool = multimedia_reader.MultimediaReaderTool(workspace_directory, self.client, self.uploadCache)
+        self.datasheetQueryTool = datasheets.DatasheetQueryTool(workspace_directory)
+
+        function_declarations = self.mobileTool.definitions + self.editTool.definitions + self.bashTool.definitions + self.jobTool.definitions + self.searchTool.definitions + self.workspaceSearchTool.definitions + self.webFetchTool.definitions + self.multimediaReaderTool.definitions + self.datasheetQueryTool.definitions
+        tools = types.Tool(function_declarations=function_declarations)
+        self.config = types.GenerateContentConfig(tools=[tools, ],
+                                                  system_instruction=None, # Experimental -> do not put system prompt.
+                                                  temperature=0.0,
+                                                  #media_resolution="MEDIA_RESOLUTION_HIGH", # this doesn't work?
+        )
+
+    def render_workspace(self) -> str:
+        """
+        What changed in the workspace since the last turn, or the full tree if the model may have
+        lost track of it: on the first turn, or once the last full tree or any change since was
+        collapsed or dropped from the context window. Record the message it's sent in with
+        `workspace_entries.append`.
+        """
+        full_tree = not self.workspace_entries or not all(self.contextWindow.sent_verbatim(entry) for entry in self.workspace_entries)
+        if full_tree:
+            self.workspace_entries = []
+        return self.workspaceIndex.render(full=full_tree)
+
+    async def start(self):
+        """Open the shared HTTP session and warm up the bash shell. Must run inside the event loop."""
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(ssl=ssl_context, limit=32, limit_per_host=8, keepalive_timeout=60),
+        )
+        self.mobileTool.http_session = self.http_session
+        self.webFetchTool.http_session = self.http_session
+        self.downloadManager.http_session = self.http_session
+        await self.bashTool.start()
+        logging.warning(f"Agent runtime started for {self.workspace_directory}")
+
+    async def close(self):
+        self.bashTool.stop()
+        await self.jobTool.stop()
+        self.workspaceIndex.close()
+        self.searchTool.cache.close()
+        await self.webFetchTool.stop()
+        if self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
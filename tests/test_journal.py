@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import MessageJournal
+
+
+def _forbid_compaction(monkeypatch):
+    def compact(self, messages):
+        raise AssertionError("journal was compacted instead of appended to")
+    monkeypatch.setattr(MessageJournal, "compact", compact)
+
+
+def test_first_two_saves_of_a_new_journal_append(tmp_path, monkeypatch):
+    file_path = str(tmp_path / ".actualCodeMessagesData")
+    journal = MessageJournal(file_path)
+    assert journal.load() == []
+    _forbid_compaction(monkeypatch)
+
+    messages = ["system prompt", "Understood."]
+    journal.save(messages)
+    size_after_first = os.path.getsize(file_path)
+    messages.append("first prompt")
+    journal.save(messages)
+    journal.close()
+
+    assert os.path.getsize(file_path) > size_after_first
+    monkeypatch.undo()
+    assert MessageJournal(file_path).load() == messages
+
+
+def test_load_messages_on_a_new_workspace_then_save_appends(tmp_path, monkeypatch):
+    utils = pytest.importorskip("utils", exc_type=ImportError)
+    file_path = str(tmp_path / ".actualCodeMessagesData")
+    messages = utils.load_messages(file_path)
+    assert messages == []
+    _forbid_compaction(monkeypatch)
+
+    messages += ["system prompt", "Understood."]
+    utils.save_messages(file_path, messages)
+    messages.append("first prompt")
+    utils.save_messages(file_path, messages)
+    utils._get_journal(file_path).close()
+
+    monkeypatch.undo()
+    assert MessageJournal(file_path).load() == messages
@@ -0,0 +1,166 @@
+import os
+import stat
+import uuid
+import codecs
+import shutil
+import tempfile
+
+_umask = os.umask(0)
+os.umask(_umask)
+NEW_FILE_MODE = 0o666 & ~_umask
+
+# Byte order marks we recognize, longest first so UTF-32 isn't mistaken for UTF-16.
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def decode_text(data: bytes) -> tuple[str, str, str]:
+    """
+    Decode file content the way `Path.read_text` would (universal newlines), and also return the
+    encoding and newline convention it used, so the file can be written back the same way.
+    """
+    encoding = "utf-8"
+    for bom, bom_encoding in BOMS:
+        if data.startswith(bom):
+            encoding = bom_encoding
+            break
+    text = data.decode(encoding)
+    newline = "\r\n" if "\r\n" in text else "\n"
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text, encoding, newline
+
+
+def encode_text(text: str, encoding: str = "utf-8", newline: str = "\n") -> bytes:
+    if newline != "\n":
+        text = text.replace("\n", newline)
+    return text.encode(encoding)
+
+
+class PartialCommitError(OSError):
+    """A batch failed part-way through its renames and couldn't be rolled back completely."""
+
+    def __init__(self, message: str, committed: list[str]):
+        super().__init__(message)
+        self.committed = committed  # targets left with their new content
+
+
+class AtomicWriteBatch:
+    """
+    Replaces files so a crash never leaves one half-written: each file's new content goes to a
+    temporary file next to it, and only when all of them are written are they renamed over the
+    originals. If one of the renames fails, the files already replaced are restored from backups
+    of the originals, so the batch changes either every file or none. With `fsync`, the data is
+    flushed to disk once per file right before the renames, and each directory once after them,
+    rather than on every write call.
+    """
+
+    def __init__(self, fsync: bool = True):
+        self.fsync = fsync
+        self._pending = []  # (temporary path, target path)
+
+    def write(self, path: str, data: bytes) -> None:
+        """Stage `data` as the new content of `path`. The file itself is untouched until `commit`."""
+        target = os.path.realpath(path)  # replace the file a symlink points to, not the symlink
+        try:
+            mode = stat.S_IMODE(os.stat(target).st_mode)
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        directory, name = os.path.split(target)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, mode)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._pending.append((tmp_path, target))
+
+    def commit(self) -> None:
+        """Swap all staged files in. Raises PartialCommitError if a failure couldn't be rolled back."""
+        backups = {}  # target -> backup of its original content, or None if it didn't exist
+        try:
+            if self.fsync:
+                for tmp_path, _ in self._pending:
+                    fd = os.open(tmp_path, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            if len(self._pending) > 1:
+                for _, target in self._pending:
+                    backups[target] = _backup(target)
+            directories = set()
+            replaced = []
+            try:
+                while self._pending:
+                    tmp_path, target = self._pending[0]
+                    os.replace(tmp_path, target)
+                    self._pending.pop(0)
+                    replaced.append(target)
+                    directories.add(os.path.dirname(target))
+            except BaseException as e:
+                _rollback(replaced, backups, e)
+                raise
+            if self.fsync:
+                for directory in directories:
+                    fd = os.open(directory, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+        finally:
+            for backup in backups.values():
+                if backup is not None:
+                    try:
+                        os.unlink(backup)
+                    except OSError:
+                        pass
+            self.abort()
+
+    def abort(self) -> None:
+        """Throw away whatever hasn't been committed."""
+        for tmp_path, _ in self._pending:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        self._pending = []
+
+
+def _backup(target: str) -> str | None:
+    """Keep the current content of `target` under a hidden name next to it (a hard link where possible)."""
+    if not os.path.exists(target):
+        return None
+    directory, name = os.path.split(target)
+    backup = os.path.join(directory, f".{name}.{uuid.uuid4().hex}.orig")
+    try:
+        os.link(target, backup)
+    except OSError:
+        shutil.copy2(target, backup)
+    return backup
+
+
+def _rollback(replaced: list[str], backups: dict, error: BaseException) -> None:
+    """Put back the originals of the targets replaced before `error`."""
+    committed = []
+    for target in reversed(replaced):
+        backup = backups.get(target)
+        try:
+            if backup is None:
+                os.unlink(target)
+            else:
+                os.replace(backup, target)
+                backups[target] = None
+        except OSError:
+            committed.append(target)
+    if committed:
+        raise PartialCommitError(
+            f"{error}; could not restore the previous content of {', '.join(committed)}", committed
+        ) from error
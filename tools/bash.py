@@ -1,16 +1,57 @@
 import asyncio
+import codecs
+import contextlib
+import itertools
 import os
+import re
+import shlex
+import tempfile
+import time
 from typing import Any, Literal
 
 from .base import ToolError
 
+# How much of a command's output goes back to the model; the rest is spilled to a log file
+OUTPUT_HEAD_BYTES = 8 * 1024
+OUTPUT_TAIL_BYTES = 16 * 1024
+_command_ids = itertools.count(1)
+
+
+# Commands that change the shell's own state (working directory, variables, options) must run
+# in the primary session so later commands see the change.
+STATEFUL_COMMAND = re.compile(
+    r"(?:^|[;&|\n(`]|\$\()\s*(?:(?:cd|pushd|popd|export|unset|source|alias|unalias|set|shopt|ulimit|umask|declare|typeset|readonly|conda|nvm|pyenv|deactivate|exec)\b|\.\s|[A-Za-z_][A-Za-z0-9_]*=)"
+)
+MAX_SESSIONS = 4
+# Bash's own variables, which a secondary shell keeps rather than copying from the primary
+SHELL_VARIABLES = "BASH|BASH_[A-Z_]+|BASHOPTS|BASHPID|SHELLOPTS|EUID|UID|PPID|GROUPS|RANDOM|SRANDOM|SECONDS|LINENO|EPOCHREALTIME|EPOCHSECONDS|FUNCNAME|HISTCMD|PIPESTATUS|DIRSTACK|_"
+
+
+def is_stateful(command: str) -> bool:
+    return STATEFUL_COMMAND.search(command) is not None
+
+
 class BashTool():
-    def __init__(self, workspace_directory: str):
+    """
+    Runs bash_tool commands on a small pool of shells. The primary shell holds the state the
+    model sees (working directory, variables, functions, aliases, shell options, an activated
+    venv) and runs every command that changes it. Other commands run on whichever shell is
+    idle, so independent commands issued in the same turn run in parallel; a secondary shell
+    first loads the primary's latest state, and commands wait for any state change that's in
+    progress before they start.
+    """
+
+    def __init__(self, workspace_directory: str, max_sessions: int = MAX_SESSIONS):
         self.workspace_directory = workspace_directory
-        self._session = None
+        self.max_sessions = max_sessions
+        self._sessions: list[_BashSession] = []
+        self._pool_changed = asyncio.Condition()
+        self._state_lock = asyncio.Lock()
+        self._state_version = 0
+        self._state_path = None  # where the primary shell exports its state, created by start()
         self.definitions = [{
             "name": "bash_tool",
-            "description": f"Execute Bash shell commands within a persistent session. The Bash session maintains state, including environment variables and working directory, between commands. All commands execute with the working directory set to {self.workspace_directory}. Use the 'restart' parameter to reset the shell session.",
+            "description": f"Execute Bash shell commands within a persistent session. The Bash session maintains state, including environment variables and working directory, between commands. All commands execute with the working directory set to {self.workspace_directory}. Independent commands issued in the same turn run in parallel. Use the 'restart' parameter to reset the shell session.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -32,38 +73,227 @@ class BashTool():
         self, command: str | None = None, restart: bool = False, **kwargs
     ):
         if restart:
-            if self._session:
-                self._session.stop()
-            self._session = _BashSession(self.workspace_directory)
-            await self._session.start()
+            self.stop()
+            await self.start()
 
             return {
                 "type": "text",
                 "text": "tool has been restarted."
             }
 
-        if self._session is None:
-            self._session = _BashSession(self.workspace_directory)
-            await self._session.start()
+        await self.start()
 
         if command is not None:
-            return await self._session.run(command)
+            if is_stateful(command):
+                async with self._state_lock:
+                    return await self._run(command, lambda session: session is self._sessions[0])
+            async with self._state_lock:
+                pass  # let a pending change to the shell state land first
+            return await self._run(command, lambda session: True)
 
         raise ToolError("no command provided.")
-        
-    
-    
-    
-    
+
+    async def start(self):
+        """Start the primary shell ahead of the first command so it's warm when the model needs it."""
+        if self._state_path is None:
+            fd, self._state_path = tempfile.mkstemp(prefix="actualcode-bash-state-", suffix=".sh")
+            os.close(fd)
+        if not self._sessions:
+            session = _BashSession(self.workspace_directory)
+            self._sessions.append(session)
+            await session.start()
+
+    def stop(self):
+        for session in self._sessions:
+            session.stop()
+        self._sessions = []
+        self._state_version = 0
+        if self._state_path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._state_path)
+            self._state_path = None
+
+    async def _checkout(self, eligible) -> "_BashSession":
+        """Wait for an idle session accepted by `eligible`, starting a new one if the pool has room."""
+        async with self._pool_changed:
+            while True:
+                session = next((session for session in self._sessions if not session.busy and eligible(session)), None)
+                if session is None and len(self._sessions) < self.max_sessions:
+                    session = _BashSession(self.workspace_directory)
+                    if eligible(session):
+                        self._sessions.append(session)
+                        await session.start()
+                    else:
+                        session = None
+                if session is not None:
+                    session.busy = True
+                    return session
+                await self._pool_changed.wait()
+
+    async def _release(self, session: "_BashSession"):
+        session.busy = False
+        if session is not self._sessions[0] and (session.exited or session.timed_out):
+            # A broken secondary shell is just replaced; only the primary needs an explicit restart.
+            session.stop()
+            self._sessions.remove(session)
+        async with self._pool_changed:
+            self._pool_changed.notify_all()
+
+    async def _run(self, command: str, eligible):
+        session = await self._checkout(eligible)
+        try:
+            if session is self._sessions[0]:
+                # Save the primary's state for the other shells once the command is done
+                result = await session.run(command, after=_save_state(self._state_path))
+                self._state_version += 1
+                session.state_version = self._state_version
+                return result
+            before = ""
+            if session.state_version != self._state_version:
+                before = f"source {shlex.quote(self._state_path)} >/dev/null 2>&1\n"
+                session.state_version = self._state_version
+            return await session.run(command, before=before)
+        finally:
+            await self._release(session)
+
+
+def _save_state(path: str) -> str:
+    """Shell code that writes everything a command can change about the shell to `path`, as a script another shell can source."""
+    return (
+        f"{{ declare -p | grep -Ev '^declare -[-a-zA-Z]* ({SHELL_VARIABLES})(=|$)'; declare -f; alias -p; shopt -p; set +o; "
+        f"printf 'cd %q\\n' \"$PWD\"; }} >| {shlex.quote(path)}\n"
+    )
+
+
+class _OutputCapture:
+    """
+    Bounded capture of one stream of one command. The first `head_bytes` and the last
+    `tail_bytes` are kept in memory; once the output outgrows that, everything is also spilled
+    to `log_path` so the model can page through the full log. The last few bytes are held
+    back until it's clear they aren't the start of the sentinel.
+    """
+
+    def __init__(self, sentinel: bytes, log_path: str, head_bytes: int = OUTPUT_HEAD_BYTES, tail_bytes: int = OUTPUT_TAIL_BYTES):
+        self.sentinel = sentinel
+        self.log_path = log_path
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.done = False
+        self._carry = b""
+        self._log_file = None
+
+    def feed(self, data: bytes) -> bool:
+        """Consume `data`; return True once the sentinel has been seen."""
+        if self.done:
+            return True
+        data = self._carry + data
+        index = data.find(self.sentinel)
+        if index != -1:
+            self._commit(data[:index])
+            self._carry = b""
+            self.finish()
+            return True
+        keep = len(self.sentinel) - 1
+        self._commit(data[:-keep])
+        self._carry = data[-keep:]
+        return False
+
+    def _commit(self, data: bytes):
+        if not data:
+            return
+        self.total_bytes += len(data)
+        self.total_lines += data.count(b"\n")
+        if self._log_file is not None:
+            self._log_file.write(data)
+            self.tail += data
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[:len(self.tail) - self.tail_bytes]
+            return
+        self.head += data
+        if len(self.head) > self.head_bytes + self.tail_bytes:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            self._log_file = open(self.log_path, "wb")
+            self._log_file.write(self.head)
+            self.tail = self.head[-self.tail_bytes:]
+            del self.head[self.head_bytes:]
+
+    def finish(self):
+        """Stop capturing, e.g. because the sentinel arrived or the shell exited."""
+        self._commit(self._carry)
+        self._carry = b""
+        self.done = True
+        if self._log_file is not None:
+            self._log_file.close()
+
+    def text(self, relative_to: str) -> str:
+        if self._log_file is None:
+            return self.head.decode(errors="replace")
+        omitted = self.total_bytes - len(self.head) - len(self.tail)
+        return (
+            self.head.decode(errors="replace")
+            + f"\n... [{omitted} bytes omitted. Output was {self.total_bytes} bytes, {self.total_lines} lines; "
+            + f"full log at {os.path.relpath(self.log_path, relative_to)} (use text_editor_tool view with view_range to page through it)] ...\n"
+            + self.tail.decode(errors="replace")
+        )
+
+
+class _BashProtocol(asyncio.SubprocessProtocol):
+    """
+    Feeds the shell's stdout and stderr to the current command's captures as bytes arrive,
+    and resolves a waiter the moment the sentinel line shows up on a stream.
+    """
+
+    def __init__(self, sentinel: bytes):
+        self.sentinel = sentinel
+        self._captures = {}
+        self._waiters = {}
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.exited = False
+
+    def begin(self, log_path_prefix: str) -> dict[int, _OutputCapture]:
+        """Start capturing a new command's output."""
+        self._captures = {
+            1: _OutputCapture(self.sentinel, f"{log_path_prefix}.stdout.log"),
+            2: _OutputCapture(self.sentinel, f"{log_path_prefix}.stderr.log"),
+        }
+        self._waiters = {fd: asyncio.get_running_loop().create_future() for fd in self._captures}
+        if self.exited:
+            self.process_exited()
+        return self._captures
+
+    def pipe_data_received(self, fd: int, data: bytes):
+        if fd == 1:
+            print(self._decoder.decode(data).replace(self.sentinel.decode(), ""), end="", flush=True)
+        capture = self._captures.get(fd)
+        if capture is not None and capture.feed(data):
+            waiter = self._waiters[fd]
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def process_exited(self):
+        self.exited = True
+        for fd, waiter in self._waiters.items():
+            self._captures[fd].finish()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait(self):
+        """Wait until both streams have seen the sentinel (or the shell exited)."""
+        await asyncio.gather(*self._waiters.values())
+
 
 class _BashSession:
     """A session of a bash shell."""
 
     _started: bool
-    _process: asyncio.subprocess.Process
+    _transport: asyncio.SubprocessTransport
+    _protocol: _BashProtocol
 
     command: str = "/bin/bash"
-    _output_delay: float = 0.5  # seconds
     _timeout: float = 300.0  # seconds
     _sentinel: str = "<<exit>>"
 
@@ -71,15 +301,18 @@ class _BashSession:
         self._started = False
         self._timed_out = False
         self.workspace_directory = workspace_diretory
+        self.busy = False
+        self.state_version = 0  # version of the primary's saved state this shell has loaded
 
     async def start(self):
         if self._started:
             return
 
-        self._process = await asyncio.create_subprocess_shell(
+        loop = asyncio.get_running_loop()
+        self._transport, self._protocol = await loop.subprocess_shell(
+            lambda: _BashProtocol(f"{self._sentinel}\n".encode()),
             self.command,
             preexec_fn=os.setsid,
-            shell=True,
             bufsize=0,
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
@@ -93,68 +326,62 @@ class _BashSession:
         """Terminate the bash shell."""
         if not self._started:
             raise ToolError("Session has not started.")
-        if self._process.returncode is not None:
-            return
-        self._process.terminate()
+        if self._transport.get_returncode() is None:
+            self._transport.terminate()
+        self._transport.close()
+
+    @property
+    def exited(self) -> bool:
+        return self._started and self._transport.get_returncode() is not None
+
+    @property
+    def timed_out(self) -> bool:
+        return self._timed_out
 
-    async def run(self, command: str):
-        """Execute a command in the bash shell."""
+    async def run(self, command: str, before: str = "", after: str = ""):
+        """Execute a command in the bash shell. `before` and `after` are extra lines run around it."""
         if not self._started:
             raise ToolError("Session has not started.")
-        if self._process.returncode is not None:
+        if self._transport.get_returncode() is not None:
             return {
                 "type": "text",
-                "text": f"Error: tool must be restarted. Bash has exited with returncode {self._process.returncode}"
+                "text": f"Error: tool must be restarted. Bash has exited with returncode {self._transport.get_returncode()}"
             }
             
         if self._timed_out:
             raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
+                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted. Use bash_job_tool for long-running commands.",
             )
 
-        # we know these are not None because we created the process with PIPEs
-        assert self._process.stdin
-        assert self._process.stdout
-        assert self._process.stderr
+        log_path_prefix = os.path.join(self.workspace_directory, ".actualCodeLogs", f"bash-{int(time.time())}-{os.getpid()}-{next(_command_ids)}")
+        captures = self._protocol.begin(log_path_prefix)
 
-        # send command to the process
-        self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
+        # send command to the process. The sentinel goes on its own line so a trailing `&` or
+        # comment in the command can't swallow it, and to both streams so stderr is complete too.
+        self._transport.get_pipe_transport(0).write(
+            f"{before}{command}\n{after}echo '{self._sentinel}'; echo '{self._sentinel}' >&2\n".encode()
         )
-        await self._process.stdin.drain()
 
-        # read output from the process, until the sentinel is found
+        # wait until the sentinel shows up on both streams
         try:
             print("Bash command in progress...")
             async with asyncio.timeout(self._timeout):
-                while True:
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = self._process.stdout._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
-                    print(output, end="")
-                    if self._sentinel in output:
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
-                        break
+                await self._protocol.wait()
             print("Done")
         except asyncio.TimeoutError:
             self._timed_out = True
             raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
+                f"timed out: bash has not returned in {self._timeout} seconds and must be restarted. Use bash_job_tool for long-running commands.",
             ) from None
 
+        output = captures[1].text(self.workspace_directory)
         if output.endswith("\n"):
             output = output[:-1]
 
-        error = self._process.stderr._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
+        error = captures[2].text(self.workspace_directory)
         if error.endswith("\n"):
             error = error[:-1]
 
-        # clear the buffers so that the next output can be read correctly
-        self._process.stdout._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-        self._process.stderr._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-
         if error:
             return {
                 "type": "text",
@@ -164,5 +391,3 @@ class _BashSession:
                 "type": "text",
                 "text": f"Output: {output}"
         }
-
-    
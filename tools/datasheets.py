@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import math
+import shutil
+import asyncio
+import logging
+import subprocess
+from collections import Counter
+from pathlib import Path
+
+from .base import ToolError
+from .upload_cache import file_sha256
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+CHUNK_CHARS = 1500
+DEFAULT_MAX_RESULTS = 5
+MAX_PAGES_PER_CALL = 10
+BM25_K1 = 1.5
+BM25_B = 0.75
+TEXT_SUFFIXES = {".txt", ".md", ".rst", ".csv", ".h", ".c", ".cpp", ".ino", ".py", ".json", ".html", ".htm", ".xml"}
+# Numbered headings like "7.5.2 I2C Address" or "Table 12. Register map", used to label chunks
+HEADING = re.compile(r"^\s*((?:\d+(?:\.\d+)*\.?|Table \d+\.?|Figure \d+\.?)\s+[A-Z][^\n]{2,80})$", re.MULTILINE)
+TOKEN = re.compile(r"[a-z0-9_]+")
+
+
+def _tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+
+def extract_pages(file_path: str) -> list[str]:
+    """Text of each page of a PDF (with pypdf, or poppler's pdftotext), or of a text file as a single page."""
+    if Path(file_path).suffix.lower() in TEXT_SUFFIXES:
+        return [Path(file_path).read_text(errors="replace")]
+    if pypdf is not None:
+        reader = pypdf.PdfReader(file_path)
+        return [page.extract_text() or "" for page in reader.pages]
+    if shutil.which("pdftotext"):
+        result = subprocess.run(["pdftotext", "-layout", file_path, "-"], capture_output=True, check=True)
+        return result.stdout.decode(errors="replace").split("\f")[:-1] or [""]
+    raise ToolError("Can't extract text from PDFs: install the pypdf package (pip install pypdf) or poppler's pdftotext.")
+
+
+def chunk_pages(pages: list[str]) -> list[dict]:
+    """Split pages into chunks of about CHUNK_CHARS on line and heading boundaries, each labelled with its page and section."""
+    chunks = []
+    section = ""
+    for page_number, page in enumerate(pages, 1):
+        current = []
+        size = 0
+        chunk_section = section
+        for line in page.splitlines():
+            heading = HEADING.match(line)
+            # Start a new chunk at a heading unless the current one is still small, and at the size limit
+            if current and (size + len(line) > CHUNK_CHARS or (heading and size > CHUNK_CHARS // 4)):
+                chunks.append({"page": page_number, "section": chunk_section, "text": "\n".join(current)})
+                current, size = [], 0
+            if heading:
+                section = heading.group(1).strip()
+            if not current or (heading and not chunk_section):
+                chunk_section = section
+            current.append(line)
+            size += len(line) + 1
+        if "".join(current).strip():
+            chunks.append({"page": page_number, "section": chunk_section, "text": "\n".join(current)})
+    return chunks
+
+
+class _Document:
+    """A document's chunks with the term statistics BM25 needs."""
+
+    def __init__(self, relative_path: str, pages: list[str], chunks: list[dict]):
+        self.relative_path = relative_path
+        self.pages = pages
+        self.page_count = len(pages)
+        self.chunks = chunks
+        self.term_counts = [Counter(_tokenize(chunk["section"] + "\n" + chunk["text"])) for chunk in chunks]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+
+
+class DocumentStore:
+    """
+    Extracted text of the datasheets and manuals in the workspace, kept in `.actualCodeDocs` keyed by
+    the SHA-256 of each file, so a document is only parsed once however often it's asked about.
+    Queries are ranked with BM25 over ~1500-character chunks across all requested documents.
+    """
+
+    def __init__(self, workspace_directory: str):
+        self.workspace_directory = workspace_directory
+        self.store_directory = os.path.join(workspace_directory, ".actualCodeDocs")
+        self._documents = {}  # sha256 -> _Document
+
+    def load(self, relative_path: str) -> _Document:
+        """Return the document for a workspace file, extracting and storing its text the first time."""
+        absolute_path = os.path.join(self.workspace_directory, relative_path)
+        sha256 = file_sha256(absolute_path)
+        document = self._documents.get(sha256)
+        if document is not None:
+            return document
+
+        store_path = os.path.join(self.store_directory, f"{sha256}.json")
+        stored = None
+        if os.path.exists(store_path):
+            try:
+                with open(store_path) as f:
+                    stored = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Re-extracting {relative_path}, unreadable store entry {store_path}: {e}")
+        if stored is None:
+            pages = extract_pages(absolute_path)
+            stored = {"path": relative_path, "pages": pages, "chunks": chunk_pages(pages)}
+            os.makedirs(self.store_directory, exist_ok=True)
+            tmp_path = store_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, store_path)
+            logging.warning(f"Indexed {relative_path}: {len(pages)} pages, {len(stored['chunks'])} chunks")
+
+        document = _Document(relative_path, stored["pages"], stored["chunks"])
+        self._documents[sha256] = document
+        return document
+
+    def search(self, documents: list[_Document], query: str, max_results: int) -> list[tuple[float, _Document, dict]]:
+        terms = set(_tokenize(query))
+        chunk_count = sum(len(document.chunks) for document in documents)
+        if not terms or not chunk_count:
+            return []
+        average_length = sum(sum(document.lengths) for document in documents) / chunk_count
+        document_frequency = {
+            term: sum(1 for document in documents for counts in document.term_counts if term in counts)
+            for term in terms
+        }
+        idf = {
+            term: math.log(1 + (chunk_count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+        scored = []
+        for document in documents:
+            for chunk, counts, length in zip(document.chunks, document.term_counts, document.lengths):
+                score = 0.0
+                for term in terms:
+                    frequency = counts.get(term)
+                    if frequency:
+                        score += idf[term] * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+                if score > 0:
+                    scored.append((score, document, chunk))
+        scored.sort(key=lambda result: -result[0])
+        return scored[:max_results]
+
+
+class DatasheetQueryTool():
+    def __init__(self, workspace_directory: str):
+        self.workspace_directory = workspace_directory
+        self.store = DocumentStore(workspace_directory)
+        self.definitions = [{
+            "name": "datasheet_query_tool",
+            "description": "Answers questions about datasheets, manuals and other documents (PDF or text) saved in the workspace by returning only their most relevant passages, with page numbers and section titles. Much faster and cheaper than multimedia_reader_tool for looking up specific facts like I2C addresses, register maps, pinouts or timing values. Documents are parsed once and cached.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "files": {
+                        "type": "array",
+                        "description": f"Relative file paths (from {self.workspace_directory}) of the documents to search.",
+                        "items": { "type": "string" }
+                    },
+                    "query": {
+                        "type": "string",
+                        "description": "Keywords to look for, e.g. 'I2C slave address' or 'CTRL_REG1 register bits'. Use the terms the datasheet itself would use."
+                    },
+                    "pages": {
+                        "type": "array",
+                        "description": f"Optional. Instead of searching, return the full text of these pages (1-indexed, at most {MAX_PAGES_PER_CALL}) of the first file, e.g. to read a whole register table found by a query.",
+                        "items": { "type": "integer" }
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": f"Optional. Number of passages to return. Defaults to {DEFAULT_MAX_RESULTS}."
+                    }
+                },
+                "required": ["files"]
+            }
+        }]
+
+    async def __call__(
+        self,
+        *,
+        files: list[str],
+        query: str | None = None,
+        pages: list[int] | None = None,
+        max_results: int | None = None,
+        **kwargs,
+    ):
+        if not files:
+            raise ToolError("Parameter `files` must list at least one document.")
+        if not query and not pages:
+            raise ToolError("Either `query` or `pages` is required.")
+        for relative_path in files:
+            absolute_path = Path(os.path.join(self.workspace_directory, relative_path))
+            if not absolute_path.is_file():
+                raise ToolError(f"The path {relative_path} is not a file in the workspace. Download the document first.")
+        try:
+            documents = await asyncio.to_thread(lambda: [self.store.load(relative_path) for relative_path in files])
+        except ToolError:
+            raise
+        except Exception as e:
+            raise ToolError(f"Ran into {e} while extracting text from {', '.join(files)}") from None
+
+        if pages:
+            return {"type": "text", "text": self._pages(documents[0], pages)}
+
+        results = self.store.search(documents, query, int(max_results or DEFAULT_MAX_RESULTS))
+        if not results:
+            return {"type": "text", "text": f"No passages matching {query!r} in {', '.join(files)}. Try other keywords, or read pages directly with `pages`."}
+        text = f"Top {len(results)} passages for {query!r}:\n"
+        for score, document, chunk in results:
+            section = f", section {chunk['section']}" if chunk["section"] else ""
+            text += f"\n--- {document.relative_path}, page {chunk['page']} of {document.page_count}{section} (score {score:.1f}) ---\n{chunk['text'].strip()}\n"
+        return {"type": "text", "text": text}
+
+    def _pages(self, document: _Document, pages: list[int]) -> str:
+        if len(pages) > MAX_PAGES_PER_CALL:
+            raise ToolError(f"At most {MAX_PAGES_PER_CALL} pages can be read per call.")
+        text = ""
+        for page in pages:
+            if not 1 <= page <= document.page_count:
+                raise ToolError(f"Invalid page {page}. {document.relative_path} has pages {[1, document.page_count]}")
+            text += f"--- {document.relative_path}, page {page} of {document.page_count} ---\n{document.pages[page - 1].strip()}\n\n"
+        return text
@@ -0,0 +1,92 @@
+import os
+from bisect import bisect_right
+from pathlib import Path
+
+
+class Document:
+    """
+    The text of a file plus the offset where each line starts, so line ranges can be sliced without
+    splitting. `encoding` and `newline` record how the file was stored on disk, to write it back alike.
+    """
+
+    def __init__(self, text: str, encoding: str = "utf-8", newline: str = "\n"):
+        self.text = text
+        self.encoding = encoding
+        self.newline = newline
+        self.line_starts = _line_starts(text, 0)
+
+    def copy(self) -> "Document":
+        document = Document.__new__(Document)
+        document.text = self.text
+        document.encoding = self.encoding
+        document.newline = self.newline
+        document.line_starts = list(self.line_starts)
+        return document
+
+    def with_text(self, text: str) -> "Document":
+        """A new document with different text, stored the same way as this one."""
+        return Document(text, self.encoding, self.newline)
+
+    @property
+    def n_lines(self) -> int:
+        """Number of lines, counted like `len(text.split("\n"))`."""
+        return len(self.line_starts)
+
+    def line_of(self, offset: int) -> int:
+        """0-based line number of the character at `offset`."""
+        return bisect_right(self.line_starts, offset) - 1
+
+    def offset_of(self, line: int) -> int:
+        """Offset of the start of 0-based `line`; `n_lines` maps to the end of the text."""
+        return self.line_starts[line] if line < self.n_lines else len(self.text)
+
+    def lines(self, start: int, end: int | None = None) -> str:
+        """Lines [start, end) (0-based) joined by newlines, like `"\n".join(text.split("\n")[start:end])`."""
+        start = max(0, start)
+        end = self.n_lines if end is None else min(end, self.n_lines)
+        if start >= end:
+            return ""
+        end_offset = self.line_starts[end] - 1 if end < self.n_lines else len(self.text)
+        return self.text[self.line_starts[start]:end_offset]
+
+    def replace(self, start: int, end: int, new_text: str) -> None:
+        """Replace text[start:end] with `new_text`, updating the line index incrementally."""
+        first = bisect_right(self.line_starts, start)  # line starts after `start` are affected
+        last = bisect_right(self.line_starts, end)
+        delta = len(new_text) - (end - start)
+        self.text = self.text[:start] + new_text + self.text[end:]
+        self.line_starts[first:] = _line_starts(new_text, start)[1:] + [offset + delta for offset in self.line_starts[last:]]
+
+
+def _line_starts(text: str, base: int) -> list[int]:
+    starts = [base]
+    index = text.find("\n")
+    while index != -1:
+        starts.append(base + index + 1)
+        index = text.find("\n", index + 1)
+    return starts
+
+
+class DocumentCache:
+    """Keeps parsed documents for files the editor touched, revalidated by mtime and size."""
+
+    def __init__(self):
+        self._documents: dict[Path, tuple[int, int, Document]] = {}
+
+    def get(self, path: Path, read) -> Document:
+        """Return the cached document for `path`, or the one `read(path)` returns if the file changed."""
+        stat = os.stat(path)
+        cached = self._documents.get(path)
+        if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        document = read(path)
+        self._documents[path] = (stat.st_mtime_ns, stat.st_size, document)
+        return document
+
+    def put(self, path: Path, document: Document) -> None:
+        """Remember `document` as the current content of `path`, right after writing it."""
+        stat = os.stat(path)
+        self._documents[path] = (stat.st_mtime_ns, stat.st_size, document)
+
+    def forget(self, path: Path) -> None:
+        self._documents.pop(path, None)
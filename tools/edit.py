@@ -1,18 +1,34 @@
 import asyncio
-from collections import defaultdict
 import os
 from typing import Any, Literal, get_args
 from pathlib import Path
 from .base import ToolError
-from .run import run
+from workspace_index import scan_tree, render_tree
+from .atomic_write import AtomicWriteBatch, PartialCommitError, decode_text, encode_text
+from .document_cache import Document, DocumentCache
+from .edit_history import EditHistory
 
 SNIPPET_LINES: int = 4
 
 
+class PartialWriteError(ToolError):
+    """A batch of writes failed and only some of the files could be left unchanged."""
+
+    def __init__(self, message, written: list[str]):
+        super().__init__(message)
+        self.written = written  # relative paths that do have their new content
+
 class EditTool():
-    def __init__(self, workspace_directory: str):
+    def __init__(self, workspace_directory: str, persist_history: bool | None = None, fsync: bool | None = None):
         self.workspace_directory = workspace_directory
-        self._file_history = defaultdict(list)
+        if fsync is None:
+            fsync = os.environ.get("ACTUALCODE_FSYNC_WRITES", "1") == "1"
+        self.fsync = fsync
+        if persist_history is None:
+            persist_history = os.environ.get("ACTUALCODE_PERSIST_EDIT_HISTORY", "1") == "1"
+        history_path = os.path.join(workspace_directory, ".actualCodeEditHistory.jsonl") if persist_history else None
+        self._file_history = EditHistory(log_path=history_path)
+        self._documents = DocumentCache()
         self.definitions = [{
             "name": "text_editor_tool",
             "description": "Allows viewing, editing, creating, and inserting text in files and directories within the workspace directory.",
@@ -21,8 +37,8 @@ class EditTool():
                 "properties": {
                 "command": {
                     "type": "string",
-                    "enum": ["view", "str_replace", "create", "insert"],
-                    "description": "The command to execute. Supported commands: 'view' (view file or directory contents), 'str_replace' (replace a string in a file), 'create' (create a new file), 'insert' (insert text into a file)."
+                    "enum": ["view", "str_replace", "create", "insert", "multi_edit", "undo_edit"],
+                    "description": "The command to execute. Supported commands: 'view' (view file or directory contents), 'str_replace' (replace a string in a file), 'create' (create a new file), 'insert' (insert text into a file), 'multi_edit' (apply several str_replace/insert edits, to one or more files, in one call), 'undo_edit' (revert the last str_replace, insert, multi_edit or create on the file; can be repeated to go further back)."
                 },
                 "path": {
                     "type": "string",
@@ -50,6 +66,28 @@ class EditTool():
                 "insert_line": {
                     "type": "integer",
                     "description": "Required for the 'insert' command. The line number after which the new text will be inserted (0 means insert at the beginning of the file)."
+                },
+                "edits": {
+                    "type": "array",
+                    "description": "Required for the 'multi_edit' command. The edits to apply, in order; each one sees the result of the previous ones. Either all edits are applied or, if any of them fails, none are.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "command": {
+                                "type": "string",
+                                "enum": ["str_replace", "insert"],
+                                "description": "The kind of edit. Takes the same parameters as the command of the same name."
+                            },
+                            "path": {
+                                "type": "string",
+                                "description": "Optional. The file to edit, relative like the top-level `path`. Defaults to the top-level `path`."
+                            },
+                            "old_str": { "type": "string" },
+                            "new_str": { "type": "string" },
+                            "insert_line": { "type": "integer" }
+                        },
+                        "required": ["command"]
+                    }
                 }
                 },
                 "required": ["command", "path"]
@@ -60,17 +98,22 @@ class EditTool():
     async def __call__(
         self, 
         *,
-        command: Literal["view", "create", "str_replace", "insert",],
+        command: Literal["view", "create", "str_replace", "insert", "multi_edit", "undo_edit"],
         path: str,
         file_text: str | None = None,
         view_range: list[int] | None = None,
         old_str: str | None = None,
         new_str: str | None = None,
         insert_line: int | None = None,
+        edits: list[dict] | None = None,
         **kwargs,
     ):
         absolute_path = Path(os.path.join(self.workspace_directory, path))
         relative_path = path
+        if command == "multi_edit":
+            if not edits:
+                raise ToolError("Parameter `edits` is required for command: multi_edit")
+            return self.multi_edit(relative_path, edits)
         self.validate_path(command, absolute_path, relative_path)
         if command == "view":
             return await self.view(absolute_path, relative_path, view_range)
@@ -78,7 +121,8 @@ class EditTool():
             if file_text is None:
                 raise ToolError("Parameter `file_text` is required for command: create")
             self.write_file(absolute_path, relative_path, file_text)
-            self._file_history[relative_path].append(file_text)
+            # Record the text as reads will see it, with line endings normalized
+            self._file_history.record(relative_path, None, decode_text(encode_text(file_text))[0])
             return {
                 "type": "text",
                 "text": f"File created successfully at: {relative_path}"
@@ -97,9 +141,11 @@ class EditTool():
             if new_str is None:
                 raise ToolError("Parameter `new_str` is required for command: insert")
             return self.insert(absolute_path, relative_path, insert_line, new_str)
+        elif command == "undo_edit":
+            return self.undo_edit(absolute_path, relative_path)
         
         raise ToolError(
-            f'Unrecognized command {command}. The allowed commands for the text_editor_tool tool are: {", ".join(["view", "create", "str_replace", "insert",])}'
+            f'Unrecognized command {command}. The allowed commands for the text_editor_tool tool are: {", ".join(["view", "create", "str_replace", "insert", "multi_edit", "undo_edit"])}'
         )
         
     def validate_path(self, command: str, absolute_path: Path, relative_path: str):
@@ -130,27 +176,24 @@ class EditTool():
                     "The `view_range` parameter is not allowed when `path` points to a directory."
                 )
 
-            _, stdout, stderr = await run(
-                rf"cd {self.workspace_directory} && find {relative_path} -maxdepth 2 -not -path '*/\.*'"
-            )
-            if stderr:
-                raise ToolError(stderr)
-            stdout = f"Here's the files and directories up to 2 levels deep in {relative_path}, excluding hidden items:\n{stdout}\n"
+            entries = scan_tree(str(absolute_path), max_depth=2, prefix=relative_path.rstrip("/") or relative_path)
+            stdout = render_tree(entries, root=relative_path)
+            stdout = f"Here's the files and directories up to 2 levels deep in {relative_path}, excluding hidden items:\n{stdout}\n\n"
             
             return {
                 "type": "text",
                 "text": stdout
             }
 
-        file_content = self.read_file(absolute_path, relative_path)
+        document = self.read_document(absolute_path, relative_path)
+        file_content = document.text
         init_line = 1
         if view_range:
             if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
                 raise ToolError(
                     "Invalid `view_range`. It should be a list of two integers."
                 )
-            file_lines = file_content.split("\n")
-            n_lines_file = len(file_lines)
+            n_lines_file = document.n_lines
             init_line, final_line = view_range
             if init_line < 1 or init_line > n_lines_file:
                 raise ToolError(
@@ -166,9 +209,9 @@ class EditTool():
                 )
 
             if final_line == -1:
-                file_content = "\n".join(file_lines[init_line - 1 :])
+                file_content = document.lines(init_line - 1)
             else:
-                file_content = "\n".join(file_lines[init_line - 1 : final_line])
+                file_content = document.lines(init_line - 1, final_line)
 
         return {
                 "type": "text",
@@ -176,36 +219,108 @@ class EditTool():
         }
     
         
-    def read_file(self, absolute_path: Path, relative_path: str):
-        """Read the content of a file from a given path; raise a ToolError if an error occurs."""
+    def read_document(self, absolute_path: Path, relative_path: str) -> Document:
+        """Return the line-indexed content of a file, re-reading it only if it changed on disk."""
         try:
-            return absolute_path.read_text()
+            return self._documents.get(absolute_path, lambda path: Document(*decode_text(path.read_bytes())))
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to read {relative_path}") from None
-        
+
+    def write_document(self, absolute_path: Path, relative_path: str, document: Document):
+        """Write an edited document back and keep it cached as the file's current content."""
+        self.write_documents({relative_path: (absolute_path, document)})
+
+    def write_documents(self, documents: dict[str, tuple[Path, Document]]):
+        """
+        Write several documents atomically, in their original encoding and line endings: either every
+        file gets its new content or none does. In the rare case that a failed batch can't be rolled
+        back, PartialWriteError says which files did get their new content.
+        """
+        batch = AtomicWriteBatch(fsync=self.fsync)
+        relative_path = None
+        try:
+            for relative_path, (absolute_path, document) in documents.items():
+                batch.write(absolute_path, encode_text(document.text, document.encoding, document.newline))
+            relative_path = ", ".join(documents)
+            batch.commit()
+        except PartialCommitError as e:
+            written = [
+                relative_path for relative_path, (absolute_path, _) in documents.items()
+                if os.path.realpath(absolute_path) in e.committed
+            ]
+            for relative_path, (absolute_path, document) in documents.items():
+                if relative_path in written:
+                    self._documents.put(absolute_path, document)
+                else:
+                    self._documents.forget(absolute_path)
+            raise PartialWriteError(f"Ran into {e} while trying to write to {', '.join(documents)}", written) from None
+        except Exception as e:
+            batch.abort()
+            for absolute_path, _ in documents.values():
+                self._documents.forget(absolute_path)
+            raise ToolError(f"Ran into {e} while trying to write to {relative_path}") from None
+        for absolute_path, document in documents.values():
+            self._documents.put(absolute_path, document)
+
     def write_file(self, absolute_path: Path, relative_path: str, file: str):
         """Write the content of a file to a given path; raise a ToolError if an error occurs."""
+        batch = AtomicWriteBatch(fsync=self.fsync)
         try:
-            absolute_path.write_text(file)
+            batch.write(absolute_path, encode_text(file))
+            batch.commit()
         except Exception as e:
+            batch.abort()
             raise ToolError(f"Ran into {e} while trying to write to {relative_path}") from None
         
         
     def str_replace(self, absolute_path: Path, relative_path: str, old_str: str, new_str: str | None):
         """Implement the str_replace command, which replaces old_str with new_str in the file content"""
         # Read the file content
-        file_content = self.read_file(absolute_path, relative_path).expandtabs()
+        original = self.read_document(absolute_path, relative_path)
+        document = self._editable(original)
+        index, end = self._replace_in(document, relative_path, old_str, new_str)
+        self.write_document(absolute_path, relative_path, document)
+
+        # Save the content to history
+        self._file_history.record(relative_path, original.text, document.text)
+
+        # Create a snippet of the edited section
+        replacement_line = document.line_of(index)
+        start_line = max(0, replacement_line - SNIPPET_LINES)
+        end_line = document.line_of(end) + SNIPPET_LINES
+        snippet = document.lines(start_line, end_line + 1)
+
+        # Prepare the success message
+        success_msg = f"The file {relative_path} has been edited. "
+        success_msg += self._make_output(
+            snippet, f"a snippet of {relative_path}", start_line + 1
+        )
+        success_msg += "Review the changes and make sure they are as expected. Edit the file again if necessary."
+
+        return {
+            "type": "text",
+            "text": success_msg
+        }
+
+    def _editable(self, document: Document) -> Document:
+        """A copy of a cached document that can be edited, with tabs expanded like every edit does."""
+        if "\t" in document.text:
+            return document.with_text(document.text.expandtabs())
+        return document.copy()
+
+    def _replace_in(self, document: Document, relative_path: str, old_str: str, new_str: str | None) -> tuple[int, int]:
+        """Replace the unique occurrence of old_str in `document`; return where the new text starts and ends."""
         old_str = old_str.expandtabs()
         new_str = new_str.expandtabs() if new_str is not None else ""
 
         # Check if old_str is unique in the file
-        occurrences = file_content.count(old_str)
-        if occurrences == 0:
+        index = document.text.find(old_str)
+        if index == -1:
             raise ToolError(
                 f"No replacement was performed, old_str `{old_str}` did not appear verbatim in {relative_path}."
             )
-        elif occurrences > 1:
-            file_content_lines = file_content.split("\n")
+        elif document.text.find(old_str, index + max(1, len(old_str))) != -1:
+            file_content_lines = document.text.split("\n")
             lines = [
                 idx + 1
                 for idx, line in enumerate(file_content_lines)
@@ -216,75 +331,153 @@ class EditTool():
             )
 
         # Replace old_str with new_str
-        new_file_content = file_content.replace(old_str, new_str)
-
-        # Write the new content to the file
-        self.write_file(absolute_path, relative_path, new_file_content)
-
-        # Save the content to history
-        self._file_history[relative_path].append(file_content)
+        document.replace(index, index + len(old_str), new_str)
+        return index, index + len(new_str)
+    
+    def insert(self, absolute_path: Path, relative_path: str, insert_line: int, new_str: str):
+        """Implement the insert command, which inserts new_str at the specified line in the file content."""
+        original = self.read_document(absolute_path, relative_path)
+        document = self._editable(original)
+        start, end = self._insert_in(document, insert_line, new_str)
+        snippet = document.lines(
+            insert_line - SNIPPET_LINES, document.line_of(end) + 1 + SNIPPET_LINES
+        )
 
-        # Create a snippet of the edited section
-        replacement_line = file_content.split(old_str)[0].count("\n")
-        start_line = max(0, replacement_line - SNIPPET_LINES)
-        end_line = replacement_line + SNIPPET_LINES + new_str.count("\n")
-        snippet = "\n".join(new_file_content.split("\n")[start_line : end_line + 1])
+        self.write_document(absolute_path, relative_path, document)
+        self._file_history.record(relative_path, original.text, document.text)
 
-        # Prepare the success message
         success_msg = f"The file {relative_path} has been edited. "
         success_msg += self._make_output(
-            snippet, f"a snippet of {relative_path}", start_line + 1
+            snippet,
+            "a snippet of the edited file",
+            max(1, insert_line - SNIPPET_LINES + 1),
         )
-        success_msg += "Review the changes and make sure they are as expected. Edit the file again if necessary."
-
+        success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
         return {
             "type": "text",
             "text": success_msg
         }
-    
-    def insert(self, absolute_path: Path, relative_path: str, insert_line: int, new_str: str):
-        """Implement the insert command, which inserts new_str at the specified line in the file content."""
-        file_text = self.read_file(absolute_path, relative_path).expandtabs()
+        
+        
+    def _insert_in(self, document: Document, insert_line: int, new_str: str) -> tuple[int, int]:
+        """Insert new_str after line `insert_line` of `document`; return where the new text starts and ends."""
         new_str = new_str.expandtabs()
-        file_text_lines = file_text.split("\n")
-        n_lines_file = len(file_text_lines)
+        n_lines_file = document.n_lines
 
         if insert_line < 0 or insert_line > n_lines_file:
             raise ToolError(
                 f"Invalid `insert_line` parameter: {insert_line}. It should be within the range of lines of the file: {[0, n_lines_file]}"
             )
 
-        new_str_lines = new_str.split("\n")
-        new_file_text_lines = (
-            file_text_lines[:insert_line]
-            + new_str_lines
-            + file_text_lines[insert_line:]
-        )
-        snippet_lines = (
-            file_text_lines[max(0, insert_line - SNIPPET_LINES) : insert_line]
-            + new_str_lines
-            + file_text_lines[insert_line : insert_line + SNIPPET_LINES]
-        )
+        if insert_line < n_lines_file:
+            offset = document.offset_of(insert_line)
+            document.replace(offset, offset, new_str + "\n")
+            return offset, offset + len(new_str)
+        offset = len(document.text) + 1
+        document.replace(len(document.text), len(document.text), "\n" + new_str)
+        return offset, offset + len(new_str)
 
-        new_file_text = "\n".join(new_file_text_lines)
-        snippet = "\n".join(snippet_lines)
+    def multi_edit(self, default_path: str, edits: list[dict]):
+        """
+        Implement the multi_edit command: apply a list of str_replace/insert edits in order, in memory,
+        and write all touched files in one atomic batch, only if every edit succeeded.
+        """
+        originals = {}  # relative path -> (absolute path, document before the edits)
+        documents = {}  # relative path -> edited document
+        changed = {}  # relative path -> [start, end) ranges of new text, in the edited document
+        for number, edit in enumerate(edits, 1):
+            relative_path = edit.get("path") or default_path
+            command = edit.get("command")
+            try:
+                if relative_path not in documents:
+                    absolute_path = Path(os.path.join(self.workspace_directory, relative_path))
+                    self.validate_path(command, absolute_path, relative_path)
+                    original = self.read_document(absolute_path, relative_path)
+                    originals[relative_path] = (absolute_path, original)
+                    documents[relative_path] = self._editable(original)
+                    changed[relative_path] = []
+                document = documents[relative_path]
+                before = len(document.text)
+                if command == "str_replace":
+                    if edit.get("old_str") is None:
+                        raise ToolError("Parameter `old_str` is required for command: str_replace")
+                    start, end = self._replace_in(document, relative_path, edit["old_str"], edit.get("new_str"))
+                elif command == "insert":
+                    if edit.get("insert_line") is None:
+                        raise ToolError("Parameter `insert_line` is required for command: insert")
+                    if edit.get("new_str") is None:
+                        raise ToolError("Parameter `new_str` is required for command: insert")
+                    start, end = self._insert_in(document, int(edit["insert_line"]), edit["new_str"])
+                else:
+                    raise ToolError(f"Unrecognized command {command}. Edits in multi_edit can only use: str_replace, insert")
+            except ToolError as e:
+                raise ToolError(f"No edits were performed. Edit {number} of {len(edits)} ({command} on {relative_path}) failed: {e.message}") from None
+            _track_change(changed[relative_path], start, end, len(document.text) - before)
 
-        self.write_file(absolute_path, relative_path, new_file_text)
-        self._file_history[relative_path].append(file_text)
+        try:
+            self.write_documents({
+                relative_path: (originals[relative_path][0], document) for relative_path, document in documents.items()
+            })
+        except PartialWriteError as e:
+            for relative_path in e.written:
+                self._file_history.record(relative_path, originals[relative_path][1].text, documents[relative_path].text)
+            unchanged = [relative_path for relative_path in documents if relative_path not in e.written]
+            raise ToolError(
+                f"The edits were only partly applied. {e.message}. "
+                f"Changed (undo_edit can revert these): {', '.join(e.written)}. Unchanged: {', '.join(unchanged)}."
+            ) from None
+        except ToolError as e:
+            raise ToolError(f"No edits were performed. {e.message}") from None
+        for relative_path, document in documents.items():
+            self._file_history.record(relative_path, originals[relative_path][1].text, document.text)
 
-        success_msg = f"The file {relative_path} has been edited. "
-        success_msg += self._make_output(
-            snippet,
-            "a snippet of the edited file",
-            max(1, insert_line - SNIPPET_LINES + 1),
-        )
-        success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
+        success_msg = f"Applied {len(edits)} edits to {len(documents)} file(s): {', '.join(documents)}. "
+        for relative_path, document in documents.items():
+            for start_line, end_line in _snippet_lines(document, changed[relative_path]):
+                success_msg += self._make_output(
+                    document.lines(start_line, end_line + 1), f"a snippet of {relative_path}", start_line + 1
+                )
+        success_msg += "Review the changes and make sure they are as expected. Edit the files again if necessary."
         return {
             "type": "text",
             "text": success_msg
         }
-        
-        
+
+    def undo_edit(self, absolute_path: Path, relative_path: str):
+        """Implement the undo_edit command, which reverts the last edit made to the file."""
+        if not self._file_history.can_undo(relative_path):
+            raise ToolError(f"No edits to {relative_path} to undo.")
+        document = self.read_document(absolute_path, relative_path)
+        try:
+            old_text, changed = self._file_history.undo(relative_path, document.text)
+        except ValueError as e:
+            raise ToolError(f"Cannot undo the last edit to {relative_path}: {e}.") from None
+
+        if old_text is None:
+            try:
+                absolute_path.unlink()
+            except Exception as e:
+                raise ToolError(f"Ran into {e} while trying to remove {relative_path}") from None
+            self._documents.forget(absolute_path)
+            return {
+                "type": "text",
+                "text": f"Last edit to {relative_path} undone successfully. The file was created by that edit and has been removed."
+            }
+
+        # Show the region that changed back
+        old_document = document.with_text(old_text)
+        self.write_document(absolute_path, relative_path, old_document)
+        changed_line = old_document.line_of(min(changed, max(0, len(old_text) - 1)))
+        start_line = max(0, changed_line - SNIPPET_LINES)
+        snippet = old_document.lines(start_line, changed_line + SNIPPET_LINES + 1)
+
+        success_msg = f"Last edit to {relative_path} undone successfully. "
+        success_msg += self._make_output(snippet, f"a snippet of {relative_path}", start_line + 1)
+        return {
+            "type": "text",
+            "text": success_msg
+        }
+
     def _make_output(
         self,
         file_content: str,
@@ -305,4 +498,34 @@ class EditTool():
             f"Here's the result of running `cat -n` on {file_descriptor}:\n"
             + file_content
             + "\n"
-        )
\ No newline at end of file
+        )
+
+
+def _track_change(ranges: list[list[int]], start: int, end: int, delta: int) -> None:
+    """Record that text[start:end] is new, shifting or merging the ranges of earlier edits (`delta` is the length change)."""
+    old_end = end - delta  # where the replaced text ended before the edit
+    merged = [start, end]
+    kept = []
+    for range_start, range_end in ranges:
+        if range_end < start:
+            kept.append([range_start, range_end])
+        elif range_start > old_end:
+            kept.append([range_start + delta, range_end + delta])
+        else:
+            merged = [min(merged[0], range_start), max(merged[1], range_end + delta)]
+    ranges[:] = kept + [merged]
+
+
+def _snippet_lines(document: Document, ranges: list[list[int]]) -> list[tuple[int, int]]:
+    """0-based, inclusive line ranges to show around the changed text, with overlapping ones merged."""
+    line_ranges = sorted(
+        (max(0, document.line_of(start) - SNIPPET_LINES), document.line_of(end) + SNIPPET_LINES)
+        for start, end in ranges
+    )
+    merged = []
+    for start_line, end_line in line_ranges:
+        if merged and start_line <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_line))
+        else:
+            merged.append((start_line, end_line))
+    return merged
@@ -0,0 +1,172 @@
+import os
+import json
+import zlib
+import logging
+from collections import deque
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024  # text kept in memory across all reverse deltas
+RECORD_OVERHEAD = 64  # rough bytes per delta besides its text
+
+
+class _Delta:
+    """
+    Turns the text after an edit back into the text before it: keep `prefix` characters from
+    the start and `suffix` from the end, and put `old` in between. `old` is None when the edit
+    created the file. `crc` is the checksum of the text after the edit, so an undo never
+    applies to a file that was changed behind the editor's back.
+    """
+
+    __slots__ = ("prefix", "suffix", "old", "crc")
+
+    def __init__(self, prefix: int, suffix: int, old: str | None, crc: int):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.old = old
+        self.crc = crc
+
+    @property
+    def size(self) -> int:
+        return RECORD_OVERHEAD + len(self.old or "")
+
+    def apply(self, text: str) -> str | None:
+        if self.old is None:
+            return None
+        return text[:self.prefix] + self.old + text[len(text) - self.suffix:]
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Length of the common prefix, found by bisecting on slice comparisons so the scanning happens in C."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _make_delta(old_text: str | None, new_text: str) -> _Delta:
+    crc = zlib.crc32(new_text.encode())
+    if old_text is None:
+        return _Delta(0, 0, None, crc)
+    prefix = _common_prefix(old_text, new_text)
+    limit = min(len(old_text), len(new_text)) - prefix
+    suffix = _common_prefix(old_text[::-1][:limit], new_text[::-1][:limit])
+    return _Delta(prefix, suffix, old_text[prefix:len(old_text) - suffix], crc)
+
+
+class EditHistory:
+    """
+    Per-file undo stacks for the text editor, stored as reverse deltas rather than full copies.
+
+    Only the text an edit replaced is kept, so a one-line change to a large file costs one line.
+    When the deltas together exceed `max_bytes`, the oldest ones (across all files) are dropped.
+    If `log_path` is given, the history is also appended to that file and replayed on start, so
+    undo survives a restart of the agent.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, log_path: str | None = None):
+        self.max_bytes = max_bytes
+        self.log_path = log_path
+        self._stacks: dict[str, list[_Delta]] = {}
+        self._order = deque()  # paths in the order their deltas were recorded, oldest first
+        self._bytes = 0
+        self._log_bytes = 0
+        if log_path is not None:
+            self._replay()
+
+    def record(self, path: str, old_text: str | None, new_text: str) -> None:
+        """Remember how to get back from `new_text` to `old_text` (None if the file didn't exist)."""
+        delta = _make_delta(old_text, new_text)
+        self._push(path, delta)
+        self._evict()
+        self._append({"path": path, "prefix": delta.prefix, "suffix": delta.suffix, "old": delta.old, "crc": delta.crc})
+
+    def can_undo(self, path: str) -> bool:
+        """Whether there's an edit to `path` left to undo."""
+        return bool(self._stacks.get(path))
+
+    def undo(self, path: str, current_text: str) -> tuple[str | None, int]:
+        """
+        Return the text before the last edit to `path` (None if that edit created the file) and
+        the offset where it starts to differ from `current_text`. Raises ValueError if there is nothing to undo or the file changed since the edit.
+        """
+        stack = self._stacks.get(path)
+        if not stack:
+            raise ValueError("no edits to undo")
+        delta = stack[-1]
+        if zlib.crc32(current_text.encode()) != delta.crc:
+            raise ValueError("the file was modified outside the editor since its last edit")
+        self._pop(path)
+        self._append({"path": path, "undo": True})
+        return delta.apply(current_text), delta.prefix
+
+    def _push(self, path: str, delta: _Delta) -> None:
+        self._stacks.setdefault(path, []).append(delta)
+        self._order.append(path)
+        self._bytes += delta.size
+
+    def _pop(self, path: str) -> _Delta:
+        delta = self._stacks[path].pop()
+        self._bytes -= delta.size
+        for index in range(len(self._order) - 1, -1, -1):
+            if self._order[index] == path:
+                del self._order[index]
+                break
+        return delta
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._order:
+            path = self._order.popleft()
+            delta = self._stacks[path].pop(0)
+            self._bytes -= delta.size
+
+    def _append(self, record: dict) -> None:
+        if self.log_path is None:
+            return
+        line = json.dumps(record) + "\n"
+        try:
+            with open(self.log_path, "a") as f:
+                f.write(line)
+        except OSError as e:
+            logging.warning(f"Could not write edit history to {self.log_path}: {e}")
+            return
+        self._log_bytes += len(line)
+        if self._log_bytes > 2 * self.max_bytes:
+            self._compact()
+
+    def _replay(self) -> None:
+        if not os.path.exists(self.log_path):
+            return
+        try:
+            with open(self.log_path) as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record.get("undo"):
+                        if self._stacks.get(record["path"]):
+                            self._pop(record["path"])
+                    else:
+                        self._push(record["path"], _Delta(record["prefix"], record["suffix"], record["old"], record["crc"]))
+                        self._evict()
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring the rest of unreadable edit history {self.log_path}: {e}")
+        self._compact()
+
+    def _compact(self) -> None:
+        """Rewrite the log with only the deltas still in memory, oldest first."""
+        positions = {path: 0 for path in self._stacks}
+        lines = []
+        for path in self._order:
+            delta = self._stacks[path][positions[path]]
+            positions[path] += 1
+            lines.append(json.dumps({"path": path, "prefix": delta.prefix, "suffix": delta.suffix, "old": delta.old, "crc": delta.crc}) + "\n")
+        tmp_path = self.log_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.log_path)
+        except OSError as e:
+            logging.warning(f"Could not compact edit history {self.log_path}: {e}")
+            return
+        self._log_bytes = sum(len(line) for line in lines)
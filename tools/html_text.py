@@ -0,0 +1,136 @@
+import re
+from html.parser import HTMLParser
+
+# Never text: scripts, styles and other non-content elements.
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "head", "object"}
+# Page chrome, left out when the page has no <main>/<article> to go by.
+BOILERPLATE_TAGS = {"nav", "header", "footer", "aside", "form", "button"}
+MAIN_TAGS = {"main", "article"}
+BLOCK_TAGS = {
+    "p", "div", "section", "br", "hr", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr", "pre", "blockquote",
+    "h1", "h2", "h3", "h4", "h5", "h6", "figure", "figcaption", "main", "article", "body", "title",
+}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+MIN_MAIN_CHARS = 500  # a <main> shorter than this is probably not where the content is
+PRE_INDENT = "\x01"
+
+
+class HTMLTextExtractor(HTMLParser):
+    """
+    Incremental HTML-to-text converter: `feed` it chunks as they are downloaded, then call `text()`.
+
+    Script, style and similar elements are dropped. Text inside <main>/<article> is collected
+    separately and preferred when there's enough of it; otherwise navigation, headers, footers
+    and forms are left out of the page text. Headings become '#' lines, list items '- ' lines
+    and table cells are separated by ' | ', so the structure survives.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._stack = []
+        self._skip = 0
+        self._boilerplate = 0
+        self._main = 0
+        self._page = []
+        self._main_text = []
+        self._pre = 0
+        self._last = "\n"  # last character emitted, to join text split across `feed` calls
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in VOID_TAGS:
+            self._stack.append(tag)
+            self._enter(tag, 1)
+        if tag in BLOCK_TAGS:
+            self._emit("\n")
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._emit("#" * int(tag[1]) + " ")
+        elif tag == "li":
+            self._emit("- ")
+        elif tag in ("td", "th"):
+            self._emit(" | ")
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._emit("\n")
+
+    def handle_endtag(self, tag):
+        if tag not in self._stack:
+            return  # stray end tag
+        # Close anything left open inside this element, as browsers do
+        while self._stack:
+            open_tag = self._stack.pop()
+            self._enter(open_tag, -1)
+            if open_tag == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self._emit("\n")
+
+    def handle_data(self, data):
+        if self._pre:
+            # Protect indentation in <pre> from the whitespace cleanup in _tidy
+            if self._last in ("\n", PRE_INDENT):
+                data = "\n" + data
+                self._emit(_protect_indent(data)[1:])
+            else:
+                self._emit(_protect_indent(data))
+        else:
+            data = re.sub(r"\s+", " ", data)
+            self._emit(data[1:] if data.startswith(" ") and self._last.isspace() else data)
+
+    def _enter(self, tag: str, step: int) -> None:
+        if tag in SKIP_TAGS:
+            self._skip += step
+        elif tag in BOILERPLATE_TAGS:
+            self._boilerplate += step
+        elif tag in MAIN_TAGS:
+            self._main += step
+        elif tag == "pre":
+            self._pre += step
+
+    def _emit(self, text: str) -> None:
+        if self._skip or not text:
+            return
+        self._last = text[-1]
+        if self._main:
+            self._main_text.append(text)
+        if not self._boilerplate:
+            self._page.append(text)
+
+    def text(self) -> str:
+        self.close()
+        main_text = _tidy("".join(self._main_text))
+        if len(main_text) >= MIN_MAIN_CHARS:
+            return main_text
+        return _tidy("".join(self._page))
+
+
+def _protect_indent(text: str) -> str:
+    return re.sub(r"\n[ \t]+", lambda match: "\n" + PRE_INDENT * len(match.group()[1:].expandtabs()), text)
+
+
+def _tidy(text: str) -> str:
+    lines = [line.strip().replace(PRE_INDENT, " ") for line in text.splitlines()]
+    text = "\n".join(line for line in lines if line and line != "|")
+    return re.sub(r"\n{3,}", "\n\n", text)
+
+
+def html_to_text(html: str) -> str:
+    extractor = HTMLTextExtractor()
+    extractor.feed(html)
+    return extractor.text()
+
+
+def chunk_text(text: str, chunk_chars: int) -> list[str]:
+    """Split text into pieces of at most `chunk_chars`, preferring paragraph and then line boundaries."""
+    chunks = []
+    while len(text) > chunk_chars:
+        cut = text.rfind("\n\n", 0, chunk_chars)
+        if cut < chunk_chars // 2:
+            cut = text.rfind("\n", 0, chunk_chars)
+        if cut < chunk_chars // 2:
+            cut = chunk_chars
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        chunks.append(text)
+    return chunks
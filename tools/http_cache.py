@@ -0,0 +1,97 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+
+
+class CachedPage:
+    def __init__(self, url: str, text: str, content_hash: str, etag: str | None, last_modified: str | None, fresh_until: float):
+        self.url = url
+        self.text = text
+        self.content_hash = content_hash
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh_until = fresh_until
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the server said the page can be reused without asking again (Cache-Control max-age)."""
+        return time.time() < self.fresh_until
+
+
+class HttpCache:
+    """
+    Pages fetched by web_fetch_tool, stored under `.actualCodeHttpCache` in the workspace with their
+    validators, so a repeat fetch can be a conditional request (If-None-Match / If-Modified-Since)
+    answered by a 304. What's stored is the extracted text plus the SHA-256 of the raw body, which
+    identifies the page version. Responses marked no-store aren't kept.
+    """
+
+    def __init__(self, workspace_directory: str):
+        self.directory = os.path.join(workspace_directory, ".actualCodeHttpCache")
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def contains(self, url: str) -> bool:
+        """Whether there's an entry for `url`, without reading it."""
+        return os.path.exists(self._path(url))
+
+    def get(self, url: str) -> CachedPage | None:
+        try:
+            with open(self._path(url)) as f:
+                entry = json.load(f)
+            return CachedPage(url, entry["text"], entry["content_hash"], entry.get("etag"), entry.get("last_modified"), entry.get("fresh_until", 0))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable HTTP cache entry for {url}: {e}")
+            return None
+
+    def conditional_headers(self, page: CachedPage | None) -> dict:
+        headers = {}
+        if page is not None and page.etag:
+            headers["If-None-Match"] = page.etag
+        if page is not None and page.last_modified:
+            headers["If-Modified-Since"] = page.last_modified
+        return headers
+
+    def store(self, url: str, headers, text: str, content_hash: str) -> CachedPage:
+        """Remember a 200 response (`headers` are its response headers) and return it as a CachedPage."""
+        page = CachedPage(url, text, content_hash, headers.get("ETag"), headers.get("Last-Modified"), _fresh_until(headers))
+        if "no-store" in headers.get("Cache-Control", "").lower():
+            return page
+        self._write(page)
+        return page
+
+    def refresh(self, page: CachedPage, headers) -> CachedPage:
+        """Record a 304 for `page`: the content is unchanged, validators and freshness may be updated."""
+        page.etag = headers.get("ETag") or page.etag
+        page.last_modified = headers.get("Last-Modified") or page.last_modified
+        page.fresh_until = _fresh_until(headers)
+        self._write(page)
+        return page
+
+    def _write(self, page: CachedPage) -> None:
+        entry = {
+            "url": page.url, "etag": page.etag, "last_modified": page.last_modified, "fresh_until": page.fresh_until,
+            "content_hash": page.content_hash, "text": page.text,
+        }
+        path = self._path(page.url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(entry, f)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            logging.warning(f"Could not write HTTP cache entry for {page.url}: {e}")
+
+
+def _fresh_until(headers) -> float:
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return 0
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    return time.time() + int(max_age.group(1)) if max_age else 0
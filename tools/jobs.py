@@ -0,0 +1,169 @@
+import asyncio
+import os
+import signal
+import time
+from typing import Literal
+
+from .base import ToolError
+
+RING_BYTES = 64 * 1024  # output kept in memory per job
+DEFAULT_TAIL_LINES = 50
+KILL_GRACE_PERIOD = 5.0  # seconds between SIGTERM and SIGKILL
+
+
+class _Job:
+    """A command running in its own process group, with its output in a ring buffer and a log file."""
+
+    def __init__(self, job_id: int, command: str, process: asyncio.subprocess.Process, log_path: str, relative_log_path: str):
+        self.job_id = job_id
+        self.command = command
+        self.process = process
+        self.log_path = log_path
+        self.relative_log_path = relative_log_path
+        self.started_at = time.time()
+        self.finished_at = None
+        self.ring = bytearray()
+        self.total_bytes = 0
+        self.read_offset = 0  # total_bytes as of the last poll
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        with open(self.log_path, "wb") as log_file:
+            while chunk := await self.process.stdout.read(64 * 1024):
+                log_file.write(chunk)
+                log_file.flush()
+                self.total_bytes += len(chunk)
+                self.ring += chunk
+                if len(self.ring) > RING_BYTES:
+                    del self.ring[:len(self.ring) - RING_BYTES]
+        await self.process.wait()
+        self.finished_at = time.time()
+
+    @property
+    def running(self) -> bool:
+        return self.finished_at is None
+
+    def status(self) -> str:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        state = "running" if self.running else f"exited with returncode {self.process.returncode}"
+        return f"Job {self.job_id} ({self.command!r}): {state} after {elapsed:.1f}s, {self.total_bytes} bytes of output, log at {self.relative_log_path}"
+
+    def new_output(self) -> str:
+        """Output produced since the last call, limited to what's still in the ring buffer."""
+        unread = self.total_bytes - self.read_offset
+        self.read_offset = self.total_bytes
+        if unread == 0:
+            return ""
+        if unread > len(self.ring):
+            return f"[{unread - len(self.ring)} bytes dropped, see the log]\n" + self.ring.decode(errors="replace")
+        return self.ring[-unread:].decode(errors="replace")
+
+    def tail(self, lines: int) -> str:
+        return "\n".join(self.ring.decode(errors="replace").splitlines()[-lines:])
+
+    async def kill(self) -> None:
+        if not self.running:
+            return
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(self.process.pid, sig)
+            except ProcessLookupError:
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(self._reader), KILL_GRACE_PERIOD)
+                break
+            except asyncio.TimeoutError:
+                continue
+
+
+class JobTool():
+    def __init__(self, workspace_directory: str):
+        self.workspace_directory = workspace_directory
+        self._jobs: dict[int, _Job] = {}
+        self._next_id = 1
+        self.definitions = [{
+            "name": "bash_job_tool",
+            "description": f"Run long-running shell commands (serial monitors, firmware uploads, data capture, test loops) in the background so you can keep working while they run. Each job runs in its own process group with working directory {self.workspace_directory}, in a fresh shell: activate virtualenvs or export variables inside the command itself. Full output is logged to a file; use 'poll' to get new output, 'tail' for the last lines and 'kill' to stop a job.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "operation": {
+                        "type": "string",
+                        "enum": ["start", "poll", "tail", "kill", "list"],
+                        "description": "'start' launches `command` and returns its job_id. 'poll' returns the job's status and the output produced since the last poll. 'tail' returns the last `lines` lines of output. 'kill' stops the job (SIGTERM, then SIGKILL). 'list' shows all jobs."
+                    },
+                    "command": {
+                        "type": "string",
+                        "description": "Required for 'start'. The shell command to run in the background."
+                    },
+                    "job_id": {
+                        "type": "integer",
+                        "description": "Required for 'poll', 'tail' and 'kill'."
+                    },
+                    "lines": {
+                        "type": "integer",
+                        "description": f"Optional for 'tail'. Number of lines to return. Defaults to {DEFAULT_TAIL_LINES}."
+                    }
+                },
+                "required": ["operation"]
+            }
+        }]
+
+    async def __call__(
+        self,
+        *,
+        operation: Literal["start", "poll", "tail", "kill", "list"],
+        command: str | None = None,
+        job_id: int | None = None,
+        lines: int | None = None,
+        **kwargs,
+    ):
+        if operation == "start":
+            if not command:
+                raise ToolError("Parameter `command` is required for operation: start")
+            return await self.start(command)
+        if operation == "list":
+            if not self._jobs:
+                return {"type": "text", "text": "No background jobs."}
+            return {"type": "text", "text": "\n".join(job.status() for job in self._jobs.values())}
+
+        if operation not in ("poll", "tail", "kill"):
+            raise ToolError(f"Unrecognized operation {operation}. The allowed operations for the bash_job_tool tool are: start, poll, tail, kill, list")
+        if job_id is None:
+            raise ToolError(f"Parameter `job_id` is required for operation: {operation}")
+        job = self._jobs.get(int(job_id))
+        if job is None:
+            raise ToolError(f"No job with job_id {job_id}. Use operation 'list' to see all jobs.")
+
+        if operation == "poll":
+            output = job.new_output()
+            return {"type": "text", "text": f"{job.status()}\nNew output:\n{output}" if output else f"{job.status()}\nNo new output."}
+        if operation == "tail":
+            return {"type": "text", "text": f"{job.status()}\nLast lines:\n{job.tail(int(lines or DEFAULT_TAIL_LINES))}"}
+        await job.kill()
+        return {"type": "text", "text": job.status()}
+
+    async def start(self, command: str):
+        job_id = self._next_id
+        self._next_id += 1
+        log_directory = os.path.join(self.workspace_directory, ".actualCodeLogs")
+        os.makedirs(log_directory, exist_ok=True)
+        process = await asyncio.create_subprocess_shell(
+            command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=self.workspace_directory,
+            start_new_session=True,
+        )
+        log_path = os.path.join(log_directory, f"job-{int(time.time())}-{job_id}.log")
+        relative_log_path = os.path.relpath(log_path, self.workspace_directory)
+        self._jobs[job_id] = _Job(job_id, command, process, log_path, relative_log_path)
+        return {
+            "type": "text",
+            "text": f"Started job {job_id} (pid {process.pid}). Output is logged to {relative_log_path}."
+        }
+
+    async def stop(self):
+        """Kill every job that's still running."""
+        await asyncio.gather(*[job.kill() for job in self._jobs.values()])
@@ -0,0 +1,88 @@
+import time
+import asyncio
+import logging
+import mimetypes
+
+from google.genai import types
+
+from downloads import DownloadManager, DownloadProgress, DownloadTooLarge, filename_from_url
+from .upload_cache import UploadCache
+
+MAX_IN_MEMORY_BYTES = 32 * 1024 * 1024  # larger captures take the download-to-disk path
+
+
+class StageTimer:
+    """Time spent in each stage of a capture, driven by UploadCache's `on_state` callbacks."""
+
+    def __init__(self):
+        self.timings = {}
+        self._stage = None
+        self._since = time.monotonic()
+
+    def enter(self, stage: str | None) -> None:
+        now = time.monotonic()
+        if self._stage is not None:
+            self.timings[self._stage] = self.timings.get(self._stage, 0.0) + now - self._since
+        self._stage, self._since = stage, now
+
+    def __call__(self, file_path: str, state: str) -> None:
+        self.enter(state if state in ("hashing", "queued", "uploading", "processing", "waiting") else None)
+
+
+class MediaPipeline:
+    """
+    Gets a photo or video from the phone to the Gemini Files API with as little waiting in between as
+    possible: the capture is fetched into memory (hashed on the way) and uploaded straight from that
+    buffer, while a copy is written to `.actualCodeDownloads` at the same time. Captures over
+    `max_in_memory_bytes` are downloaded to disk and uploaded from the file. Several captures in one turn run concurrently,
+    so their Files API processing waits overlap. Per-stage timings are logged for every capture.
+    """
+
+    def __init__(self, download_manager: DownloadManager, upload_cache: UploadCache, max_in_memory_bytes: int = MAX_IN_MEMORY_BYTES):
+        self.download_manager = download_manager
+        self.upload_cache = upload_cache
+        self.max_in_memory_bytes = max_in_memory_bytes
+
+    async def capture(self, file_url: str, download_directory: str) -> tuple[types.File, dict]:
+        """Download and upload the capture at `file_url`. Returns the uploaded file and the seconds spent per stage."""
+        started = time.monotonic()
+        timer = StageTimer()
+        timer.enter("download")
+        try:
+            content, content_type, sha256 = await self.download_manager.fetch(file_url, max_bytes=self.max_in_memory_bytes, on_progress=self._show_progress)
+        except DownloadTooLarge:
+            print()
+            logging.warning(f"{file_url} is too large to upload from memory, downloading to disk first")
+            file_path = await self.download_manager.download(file_url, download_directory, on_progress=self._show_progress)
+            print()
+            uploaded_file = await self.upload_cache.upload(file_path, on_state=timer)
+        else:
+            print()
+            display_name = filename_from_url(file_url)
+            mime_type = (content_type or "").split(";")[0].strip()
+            if not mime_type or mime_type == "application/octet-stream":
+                mime_type = mimetypes.guess_type(display_name)[0] or "application/octet-stream"
+            save = asyncio.create_task(self._save(file_url, download_directory, content))
+            uploaded_file = await self.upload_cache.upload_bytes(content, mime_type, display_name, sha256=sha256, on_state=timer)
+            timer.enter(None)
+            timer.timings["save"] = await save
+        timer.enter(None)
+
+        timings = {stage: round(seconds, 3) for stage, seconds in timer.timings.items()}
+        timings["total"] = round(time.monotonic() - started, 3)
+        stats = self.download_manager.stats()
+        logging.warning(f"Capture {file_url} → {uploaded_file.name}: {timings} (downloads so far: {stats['bytes'] / 1e6:.1f} MB at {stats['throughput'] / 1e6:.1f} MB/s)")
+        return uploaded_file, timings
+
+    def _show_progress(self, progress: DownloadProgress) -> None:
+        """One status line covering every capture still downloading."""
+        print(f"\rDownloading [{', '.join(self.download_manager.stats()['active'])}]", end="", flush=True)
+
+    async def _save(self, file_url: str, download_directory: str, content: memoryview) -> float:
+        """Keep a copy of the capture in the workspace; returns the seconds it took. Failing to is not fatal."""
+        started = time.monotonic()
+        try:
+            await self.download_manager.save(file_url, download_directory, content)
+        except OSError as e:
+            logging.warning(f"Could not save a copy of {file_url}: {e}")
+        return time.monotonic() - started
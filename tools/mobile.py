@@ -1,14 +1,25 @@
 import aiohttp
 import asyncio
+import contextlib
+import logging
+import json
 import time
 import os
 
 import certifi
 import ssl
 
+API_URL = "https://api.actualcode.org"
+LONG_POLL_SECONDS = 25  # how long the status endpoint may hold a request open when nothing has changed
+EVENTS_READ_TIMEOUT = 60.0  # seconds of silence (no event or keep-alive) before giving up on the event stream
+POLL_INTERVAL_MIN = 0.25  # seconds; polling backs off from here...
+POLL_INTERVAL_MAX = 1.0  # ...to here, the fixed interval the status endpoint was always polled at
+POLL_BACKOFF = 1.5
+
 
 class MobileTool:
-    def __init__(self):
+    def __init__(self, http_session: aiohttp.ClientSession | None = None):
+        self.http_session = http_session
         self.definitions = [{
             "name": "request_photo_tool",
             "description": "Request the user to take a picture of something using their phone. Will receive the picture taken as output.",
@@ -40,9 +51,23 @@ class MobileTool:
             "required": ["instruction"]
             }
         }]
-        self.send_notification_url = 'https://api.actualcode.org/send_notification'
-        self.fetch_status_url = 'https://api.actualcode.org/fetch_notification_status'
+        self.api_url = os.environ.get("ACTUALCODE_API_URL", API_URL).rstrip("/")
+        self.send_notification_url = f'{self.api_url}/send_notification'
+        self.fetch_status_url = f'{self.api_url}/fetch_notification_status'
+        self.events_url = f'{self.api_url}/notification_events'
         self.actualcode_api_key = os.environ["ACTUALCODE_API_KEY"]
+        self.push_supported = None  # whether the server has an event stream; unknown until the first request
+
+
+    @contextlib.asynccontextmanager
+    async def _session(self):
+        """Yield the shared session if there is one, otherwise a throwaway one."""
+        if self.http_session is not None:
+            yield self.http_session
+            return
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
+            yield session
 
 
     async def make_request(self, session: aiohttp.ClientSession, url: str, data: dict) -> dict:
@@ -50,45 +75,96 @@ class MobileTool:
             return await response.json()
 
 
+    async def wait_for_status(self, session: aiohttp.ClientSession, notification_id) -> dict:
+        """
+        Wait until the notification is no longer "waiting" and return its status response. Subscribes to
+        the server's event stream so the file URL arrives as soon as the upload finishes; servers without
+        one are polled instead (long-polling where supported, otherwise with a backoff).
+        """
+        if self.push_supported is not False:
+            try:
+                status_response = await self._subscribe(session, notification_id)
+                if status_response is not None:
+                    return status_response
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.warning(f"Notification event stream failed ({e or type(e).__name__}), polling instead")
+        return await self._poll(session, notification_id)
+
+
+    async def _subscribe(self, session: aiohttp.ClientSession, notification_id) -> dict | None:
+        """Follow the server-sent events for a notification; None if there's no stream or it ends early."""
+        params = {"notification_id": notification_id}
+        # The key goes in a header, never the URL, which ends up in proxy and access logs
+        headers = {"Accept": "text/event-stream", "Authorization": f"Bearer {self.actualcode_api_key}"}
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=EVENTS_READ_TIMEOUT)
+        async with session.get(self.events_url, params=params, headers=headers, timeout=timeout) as response:
+            if response.status in (404, 405, 501) or "text/event-stream" not in response.headers.get("Content-Type", ""):
+                self.push_supported = False
+                return None
+            response.raise_for_status()
+            self.push_supported = True
+            data = []
+            async for line in response.content:
+                line = line.decode().rstrip("\r\n")
+                if line.startswith("data:"):
+                    data.append(line[5:].lstrip())
+                elif not line and data:
+                    status_response = json.loads("\n".join(data))
+                    data = []
+                    if status_response["notification_status"] != "waiting":
+                        return status_response
+                    print(".", end="", flush=True)
+        return None
+
+
+    async def _poll(self, session: aiohttp.ClientSession, notification_id) -> dict:
+        interval = POLL_INTERVAL_MIN
+        while True:
+            started = time.monotonic()
+            status_request_data = {
+                "notification_id": notification_id,
+                "wait": LONG_POLL_SECONDS,
+            }
+            status_response = await self.make_request(session, self.fetch_status_url, status_request_data)
+            if status_response["notification_status"] != "waiting":
+                return status_response
+            print(".", end="", flush=True)
+            if time.monotonic() - started >= LONG_POLL_SECONDS / 2:
+                continue  # the server held the request: it long-polls, so ask again right away
+            await asyncio.sleep(interval)
+            interval = min(interval * POLL_BACKOFF, POLL_INTERVAL_MAX)
+
+
     async def request_photo_tool(self, instruction: str, timeout=60*10) -> list:
         notification_data = {
             "notification_type": "image",
             "instruction": instruction,
             "actualcode_api_key": self.actualcode_api_key,
         }
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
+        async with self._session() as session:
             notification_response = await self.make_request(session, self.send_notification_url, notification_data)
             print(notification_response)
             notification_id = notification_response["notification_id"]
 
-            startTime = time.time()
             print(f"Waiting for photo", end="")
-            while time.time() - startTime < timeout:
-                status_request_data = {
-                    "notification_id": notification_id,
+            try:
+                status_response = await asyncio.wait_for(self.wait_for_status(session, notification_id), timeout)
+            except asyncio.TimeoutError:
+                return {
+                    "type": "text",
+                    "text": f"Error in request_photo_tool. Reason: timed out while waiting for photo"
+                }
+            notification_status = status_response["notification_status"]
+            if notification_status == "done":
+                file_url = status_response["data"]["file_url"]
+                print("Photo taken!")
+                return {
+                    "type": "image",
+                    "file_url": file_url
                 }
-                status_response = await self.make_request(session, self.fetch_status_url, status_request_data)
-                notification_status = status_response["notification_status"]
-                if notification_status == "waiting":
-                    await asyncio.sleep(1)
-                    print(".", end="", flush=True)
-                    continue
-                elif notification_status == "done":
-                    file_url = status_response["data"]["file_url"]
-                    print("Photo taken!")
-                    return {
-                        "type": "image",
-                        "file_url": file_url
-                    }
-                else:
-                    return {
-                        "type": "text",
-                        "text": f"Error in request_photo_tool. Status: {notification_status}"
-                    }
             return {
                 "type": "text",
-                "text": f"Error in request_photo_tool. Reason: timed out while waiting for photo"
+                "text": f"Error in request_photo_tool. Status: {notification_status}"
             }
 
 
@@ -98,39 +174,30 @@ class MobileTool:
             "instruction": instruction,
             "actualcode_api_key": self.actualcode_api_key,
         }
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
+        async with self._session() as session:
             notification_response = await self.make_request(session, self.send_notification_url, notification_data)
             notification_id = notification_response["notification_id"]
 
-            startTime = time.time()
             print("Waiting for video", end="")
-            while time.time() - startTime < timeout:
-                status_request_data = {
-                    "notification_id": notification_id,
+            try:
+                status_response = await asyncio.wait_for(self.wait_for_status(session, notification_id), timeout)
+            except asyncio.TimeoutError:
+                return {
+                    "type": "text",
+                    "text": f"Error in request_video_tool. Reason: timed out while waiting for video"
+                }
+            notification_status = status_response["notification_status"]
+            if notification_status == "done":
+                file_url = status_response["data"]["file_url"]
+                print("Video taken!")
+                return {
+                    "type": "video",
+                    "file_url": file_url,
+                    "fps": fps
                 }
-                status_response = await self.make_request(session, self.fetch_status_url, status_request_data)
-                notification_status = status_response["notification_status"]
-                if notification_status == "waiting":
-                    await asyncio.sleep(1)
-                    print(".", end="", flush=True)
-                    continue
-                elif notification_status == "done":
-                    file_url = status_response["data"]["file_url"]
-                    print("Video taken!")
-                    return {
-                        "type": "video",
-                        "file_url": file_url,
-                        "fps": fps
-                    }
-                else:
-                    return {
-                        "type": "text",
-                        "text": f"Error in request_video_tool. Status: {notification_status}"
-                    }
             return {
                 "type": "text",
-                "text": f"Error in request_video_tool. Reason: timed out while waiting for video"
+                "text": f"Error in request_video_tool. Status: {notification_status}"
             }
 
 if __name__ == "__main__":
@@ -4,12 +4,14 @@ from google import genai
 from google.genai import types
 import os
 from pathlib import Path
+from .upload_cache import UploadCache, UploadProgress
 
 
 class MultimediaReaderTool():
-    def __init__(self, workspace_directory: str, gemini_client: genai.Client):
+    def __init__(self, workspace_directory: str, gemini_client: genai.Client, upload_cache: UploadCache | None = None):
         self.workspace_directory = workspace_directory
         self.gemini_client = gemini_client
+        self.upload_cache = upload_cache or UploadCache(workspace_directory, gemini_client)
         self.definitions = [{
             "name": "multimedia_reader_tool",
             "description": "Uploads and grants Gemini access to multimedia files (such as .pdf, .jpg, .png, .mp4, etc.) for content analysis. Accepts a list of file paths relative to the workspace directory and uploads them to the Gemini Files API so that Gemini can read and process the contents of each file.",
@@ -34,6 +36,7 @@ class MultimediaReaderTool():
     ):
         result_str = ""
         uploaded_files = []
+        absolute_paths = []
         for relative_path in files:
             absolute_file_path = Path(os.path.join(self.workspace_directory, relative_path))
             if not absolute_file_path.exists():
@@ -42,18 +45,22 @@ class MultimediaReaderTool():
             if absolute_file_path.is_dir():
                 result_str += f"Error while reading file {relative_path} : path is a directory and not a file.\n"
                 continue
-            print(f"Uploading file {relative_path} ", end="")
-            uploaded_file = self.gemini_client.files.upload(file=str(absolute_file_path))
-            while uploaded_file.state.name == "PROCESSING":
-                print('.', end='', flush=True)
-                await asyncio.sleep(0.2)
-                uploaded_file = self.gemini_client.files.get(name = uploaded_file.name)
+            absolute_paths.append((relative_path, str(absolute_file_path)))
 
+        # Upload everything at once; the upload cache bounds how many run in parallel
+        progress = UploadProgress([absolute_path for _, absolute_path in absolute_paths])
+        results = await asyncio.gather(
+            *[self.upload_cache.upload(absolute_path, progress) for _, absolute_path in absolute_paths],
+            return_exceptions=True,
+        )
+        progress.finish()
+        for (relative_path, _), uploaded_file in zip(absolute_paths, results):
+            if isinstance(uploaded_file, Exception):
+                result_str += f"Error while uploading file {relative_path} : {uploaded_file}\n"
+                continue
             if uploaded_file.state.name == "FAILED":
                 result_str += f"Error while uploading file {relative_path} : file can't be uploaded to Gemini Files API.\n"
-                print("Upload Failed")
                 continue
-            print("success")
             result_str += f"File {relative_path} successfully uploaded."
             uploaded_files.append(uploaded_file)
         return [{
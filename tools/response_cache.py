@@ -0,0 +1,89 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+
+class ResponseCache:
+    """
+    A small persistent key/value cache with per-entry expiry, in a SQLite file inside the workspace.
+    Entries are grouped by `namespace` (one per tool) and hit/miss counts are kept per namespace
+    across sessions. Values are anything JSON-serializable.
+    """
+
+    def __init__(self, db_path: str, namespace: str, ttl: float):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value TEXT, created_at REAL, expires_at REAL, PRIMARY KEY (namespace, key))"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS stats (namespace TEXT PRIMARY KEY, hits INTEGER DEFAULT 0, misses INTEGER DEFAULT 0)"
+            )
+        return self._connection
+
+    def get(self, key: str) -> tuple[object, float] | None:
+        """Return (value, created_at) for a live entry, or None. Counts a hit or a miss."""
+        now = time.time()
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT value, created_at FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (self.namespace, key, now),
+                ).fetchone()
+                column = "hits" if row is not None else "misses"
+                with connection:
+                    connection.execute("INSERT OR IGNORE INTO stats (namespace) VALUES (?)", (self.namespace,))
+                    connection.execute(f"UPDATE stats SET {column} = {column} + 1 WHERE namespace = ?", (self.namespace,))
+        except sqlite3.Error as e:
+            logging.warning(f"Response cache {self.db_path} unavailable: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, value, ttl: float | None = None) -> None:
+        now = time.time()
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                        (self.namespace, key, json.dumps(value), now, now + (self.ttl if ttl is None else ttl)),
+                    )
+                    connection.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as e:
+            logging.warning(f"Response cache {self.db_path} unavailable: {e}")
+
+    def stats(self) -> dict:
+        """Hit/miss counts for this session and across all sessions in the workspace."""
+        total_hits, total_misses = self.hits, self.misses
+        try:
+            with self._lock:
+                row = self._connect().execute("SELECT hits, misses FROM stats WHERE namespace = ?", (self.namespace,)).fetchone()
+            if row is not None:
+                total_hits, total_misses = row
+        except sqlite3.Error:
+            pass
+        return {"hits": self.hits, "misses": self.misses, "total_hits": total_hits, "total_misses": total_misses}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
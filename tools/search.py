@@ -1,16 +1,33 @@
 import asyncio
 import os
+import re
+import time
+import logging
 from typing import Any, Literal
 from google import genai
 from google.genai import types
 
 from .base import ToolError
+from .response_cache import ResponseCache
+
+MODEL = "gemini-2.5-flash"
+DEFAULT_CACHE_TTL = 24 * 60 * 60  # seconds
+REQUEST_TIMEOUT = 60.0  # seconds per Gemini call
+MAX_CONCURRENT_REQUESTS = 4
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
 
 
 class SearchTool():
-    def __init__(self, workspace_directory: str, gemini_client: genai.Client):
+    def __init__(self, workspace_directory: str, gemini_client: genai.Client, cache_ttl: float | None = None, request_semaphore: asyncio.Semaphore | None = None):
         self.workspace_directory = workspace_directory
         self.gemini_client = gemini_client
+        self.request_semaphore = request_semaphore or asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        if cache_ttl is None:
+            cache_ttl = float(os.environ.get("ACTUALCODE_SEARCH_CACHE_TTL", DEFAULT_CACHE_TTL))
+        self.cache = ResponseCache(os.path.join(workspace_directory, ".actualCodeCache.sqlite"), "search_tool", cache_ttl)
         self.definitions = [{
             "name": "search_tool",
             "description": 'Performs a web search using Google Search (via the Gemini API) and returns the results. This tool is useful for finding information on the internet based on a query.',
@@ -21,12 +38,34 @@ class SearchTool():
                         "type": 'string',
                         "description": 'The search query to find information on the web.',
                     },
+                    "bypass_cache": {
+                        "type": "boolean",
+                        "description": "Optional. Identical searches are answered from a local cache for a day; set to true to search again, e.g. for news or recently released versions. Defaults to false.",
+                    },
                 },
                 "required": ["query"]
             }
         }]
         
-    async def __call__(self, query: str, **kwargs):
+    async def __call__(self, query: str, bypass_cache: bool = False, **kwargs):
+        key = f"{MODEL}\n{normalize_query(query)}"
+        if not bypass_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                text, created_at = cached
+                logging.warning(f"Search cache hit for {query!r} ({self.cache.stats()})")
+                age_minutes = (time.time() - created_at) / 60
+                return {
+                    "type": "text",
+                    "text": f"{text}\n\n(Cached result from {age_minutes:.0f} minutes ago. Search again with bypass_cache if it may be outdated.)",
+                }
+
+        result = await self._search(query)
+        if not result["text"].startswith("No search results"):
+            self.cache.put(key, result["text"])
+        return result
+
+    async def _search(self, query: str):
         # Define the grounding tool
         grounding_tool = types.Tool(
             google_search=types.GoogleSearch()
@@ -43,11 +82,20 @@ class SearchTool():
         )
         
         # Make the request
-        response = self.gemini_client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=query,
-            config=config,
-        )
+        try:
+            async with self.request_semaphore:
+                response = await asyncio.wait_for(
+                    self.gemini_client.aio.models.generate_content(
+                        model=MODEL,
+                        contents=query,
+                        config=config,
+                    ),
+                    REQUEST_TIMEOUT,
+                )
+        except asyncio.TimeoutError:
+            raise ToolError(f'Web search for "{query}" timed out after {REQUEST_TIMEOUT:.0f} seconds.') from None
+        except Exception as e:
+            raise ToolError(f'Web search for "{query}" failed: {e}') from None
         response_text = response.text
         response_dict = response.to_json_dict()
         grounding_metadata = response_dict.get("candidates", [{}])[0].get("grounding_metadata", {})
@@ -0,0 +1,188 @@
+import io
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+
+from google import genai
+from google.genai import types
+
+# Files API uploads are kept for 48 hours. Don't hand out a handle that's about to expire.
+DEFAULT_LIFETIME = timedelta(hours=47)
+EXPIRY_MARGIN = timedelta(hours=1)
+MAX_CONCURRENT_UPLOADS = 4
+POLL_INITIAL_DELAY = 0.2  # seconds
+POLL_MAX_DELAY = 5.0  # seconds
+
+
+def file_sha256(file_path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class UploadCache:
+    """
+    Remembers what has already been uploaded to the Gemini Files API, keyed by the SHA-256
+    of the file's content, in `.actualCodeUploadCache.json` inside the workspace. A file is
+    uploaded again only when its content changed or the remote copy has (nearly) expired.
+
+    Uploads go through the async client, at most `max_concurrent_uploads` at a time, and
+    identical content requested twice at once is only uploaded once.
+    """
+
+    def __init__(self, workspace_directory: str, gemini_client: genai.Client, max_concurrent_uploads: int = MAX_CONCURRENT_UPLOADS):
+        self.gemini_client = gemini_client
+        self.cache_path = os.path.join(workspace_directory, ".actualCodeUploadCache.json")
+        self._entries = self._load()
+        self._semaphore = asyncio.Semaphore(max_concurrent_uploads)
+        self._in_flight = {}  # sha256 -> task uploading that content
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable upload cache {self.cache_path}: {e}")
+            return {}
+
+    def _save(self) -> None:
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f, indent=1)
+        os.replace(tmp_path, self.cache_path)
+
+    def lookup(self, sha256: str) -> types.File | None:
+        """Return a handle to a live remote copy of the content, or None."""
+        entry = self._entries.get(sha256)
+        if entry is None:
+            return None
+        if datetime.fromisoformat(entry["expiration_time"]) - EXPIRY_MARGIN <= datetime.now(timezone.utc):
+            del self._entries[sha256]
+            self._save()
+            return None
+        return types.File(
+            name=entry["name"],
+            uri=entry["uri"],
+            mime_type=entry["mime_type"],
+            display_name=entry.get("display_name"),
+            state=types.FileState.ACTIVE,
+        )
+
+    def store(self, sha256: str, uploaded_file: types.File) -> None:
+        expiration_time = uploaded_file.expiration_time or datetime.now(timezone.utc) + DEFAULT_LIFETIME
+        if expiration_time.tzinfo is None:
+            expiration_time = expiration_time.replace(tzinfo=timezone.utc)
+        self._entries[sha256] = {
+            "name": uploaded_file.name,
+            "uri": uploaded_file.uri,
+            "mime_type": uploaded_file.mime_type,
+            "display_name": uploaded_file.display_name,
+            "expiration_time": expiration_time.isoformat(),
+        }
+        self._save()
+
+    async def upload(self, file_path: str, on_state=None) -> types.File:
+        """
+        Upload `file_path` unless identical content is already available remotely, and wait until it's processed.
+        `on_state(file_path, state)` is called as the upload moves through hashing/queued/uploading/processing (or waiting, when the same
+        content is already being uploaded) to its final state.
+        """
+        on_state = on_state or (lambda file_path, state: None)
+        on_state(file_path, "hashing")
+        sha256 = await asyncio.to_thread(file_sha256, file_path)
+        return await self._upload_once(sha256, file_path, lambda: self.gemini_client.aio.files.upload(file=file_path), on_state)
+
+    async def upload_bytes(self, content: bytes | memoryview, mime_type: str, display_name: str, sha256: str | None = None, on_state=None) -> types.File:
+        """
+        Like `upload`, for content that's already in memory, such as a capture fetched from the phone.
+        Pass `sha256` if it's known already to skip hashing the content again. The content isn't copied.
+        """
+        on_state = on_state or (lambda display_name, state: None)
+        if sha256 is None:
+            on_state(display_name, "hashing")
+            sha256 = await asyncio.to_thread(lambda: hashlib.sha256(content).hexdigest())
+        config = types.UploadFileConfig(mime_type=mime_type, display_name=display_name)
+        return await self._upload_once(sha256, display_name, lambda: self.gemini_client.aio.files.upload(file=_MemoryReader(content), config=config), on_state)
+
+    async def _upload_once(self, sha256: str, file_path: str, send, on_state) -> types.File:
+        cached_file = self.lookup(sha256)
+        if cached_file is not None:
+            logging.warning(f"Reusing uploaded file {cached_file.name} for {file_path}")
+            on_state(file_path, "cached")
+            return cached_file
+
+        task = self._in_flight.get(sha256)
+        if task is None:
+            task = self._in_flight[sha256] = asyncio.create_task(self._upload(sha256, file_path, send, on_state))
+            task.add_done_callback(lambda _: self._in_flight.pop(sha256, None))
+        else:
+            on_state(file_path, "waiting")  # for the same content, already being uploaded
+        uploaded_file = await asyncio.shield(task)
+        on_state(file_path, uploaded_file.state.name.lower())
+        return uploaded_file
+
+    async def _upload(self, sha256: str, file_path: str, send, on_state) -> types.File:
+        on_state(file_path, "queued")
+        async with self._semaphore:
+            on_state(file_path, "uploading")
+            uploaded_file = await send()
+        on_state(file_path, "processing")
+        delay = POLL_INITIAL_DELAY
+        while uploaded_file.state.name == "PROCESSING":
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, POLL_MAX_DELAY)
+            uploaded_file = await self.gemini_client.aio.files.get(name=uploaded_file.name)
+
+        if uploaded_file.state.name == "ACTIVE":
+            self.store(sha256, uploaded_file)
+        return uploaded_file
+
+
+class _MemoryReader(io.RawIOBase):
+    """A seekable binary file reading from a buffer in place, where io.BytesIO would copy it first."""
+
+    def __init__(self, content: bytes | memoryview):
+        self._content = memoryview(content).cast("B")
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._content[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: len(self._content)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class UploadProgress:
+    """Prints one status line covering every file in a batch of concurrent uploads."""
+
+    def __init__(self, file_paths: list[str]):
+        self._states = {file_path: "pending" for file_path in file_paths}
+
+    def __call__(self, file_path: str, state: str) -> None:
+        self._states[file_path] = state
+        status = ", ".join(f"{os.path.basename(path)}: {state}" for path, state in self._states.items())
+        print(f"\rUploading {len(self._states)} file(s) [{status}]", end="", flush=True)
+
+    def finish(self) -> None:
+        print()
@@ -1,14 +1,62 @@
 import asyncio
+import os
 import re
+import ssl
+import json
+import time
+import codecs
+import hashlib
+import logging
+import contextlib
+from collections import defaultdict
+from urllib.parse import urlsplit
+
 import aiohttp
+import certifi
 from google import genai
 from google.genai import types
 
 from .base import ToolError
+from .search import MODEL, REQUEST_TIMEOUT, MAX_CONCURRENT_REQUESTS
+from .html_text import HTMLTextExtractor, chunk_text
+from .http_cache import HttpCache, CachedPage
+from .response_cache import ResponseCache
+
+MAX_URLS = 20
+PER_HOST_LIMIT = 4  # concurrent fallback downloads per host
+FETCH_TIMEOUT = 20.0  # seconds per page
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+CHUNK_CHARS = 100_000  # text per Gemini call when processing fetched pages
+ANSWER_CACHE_TTL = 7 * 24 * 60 * 60  # seconds; answers are keyed by page content, so they only go stale with the model
+
+FALLBACK_PROMPT = """The user requested: "{prompt}"
+
+I was unable to access the URLs directly. Instead, I have fetched the text content of the pages. Please use the following content to answer the user's request. Do not attempt to access the URLs again.
+
+---
+{content}
+---
+"""
+
+EXTRACT_PROMPT = """The user requested: "{prompt}"
+
+Below is part {part} of {parts} of the text fetched for this request, from {url}. Copy out everything in it that is relevant to the request, verbatim where exact values, code or tables matter. If nothing is relevant, reply with exactly NOTHING RELEVANT.
+
+---
+{content}
+---
+"""
 
 def extract_urls(text):
     url_regex = r'(https?://[^\s]+)'
-    return re.findall(url_regex, text or '')
+    return [_trim_url(url) for url in re.findall(url_regex, text or '')]
+
+
+def _trim_url(url: str) -> str:
+    """Drop punctuation that ends the sentence rather than the URL, keeping balanced parentheses."""
+    while url and (url[-1] in ".,;:!?'\"]>" or (url[-1] == ")" and url.count(")") > url.count("("))):
+        url = url[:-1]
+    return url
 
 def extract_url_metadata(url_context_metadata):
     """
@@ -25,9 +73,20 @@ def extract_url_metadata(url_context_metadata):
     return "\n".join(url_lines)
 
 class WebFetchTool():
-    def __init__(self, workspace_directory: str, gemini_client: genai.Client):
+    def __init__(self, workspace_directory: str, gemini_client: genai.Client, http_session: aiohttp.ClientSession | None = None, request_semaphore: asyncio.Semaphore | None = None, prefetch: bool | None = None):
         self.workspace_directory = workspace_directory
         self.gemini_client = gemini_client
+        self.http_session = http_session
+        self.request_semaphore = request_semaphore or asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self._host_semaphores = defaultdict(lambda: asyncio.Semaphore(PER_HOST_LIMIT))
+        self.http_cache = HttpCache(workspace_directory)
+        self.answer_cache = ResponseCache(os.path.join(workspace_directory, ".actualCodeCache.sqlite"), "web_fetch_tool", ANSWER_CACHE_TTL)
+        if prefetch is None:
+            prefetch = os.environ.get("ACTUALCODE_WEB_FETCH_PREFETCH", "") == "1"
+        # Download pages Gemini read through url_context once more, only to fill the caches. Doubles
+        # the traffic of a first fetch, and the page we get may not be the version Gemini read.
+        self.prefetch = prefetch
+        self._background = set()
         self.definitions = [{
             "name": "web_fetch_tool",
             "description": (
@@ -51,6 +110,41 @@ class WebFetchTool():
         }]
 
     async def __call__(self, prompt: str, **kwargs):
+        urls = _prompt_urls(prompt)
+        # Pages fetched before are revalidated locally; if none changed, the earlier answer is reused
+        if urls and all(self.http_cache.contains(url) for url in urls):
+            result = await self._answer_from_cache(prompt, urls)
+            if result is not None:
+                return result
+        return await self._fetch_with_url_context(prompt, urls)
+
+    async def _answer_from_cache(self, prompt: str, urls: list[str]):
+        async with self._session() as session:
+            pages, failures = await self._fetch_pages(session, urls)
+        if failures:
+            return None  # let url_context have a go at the pages we can't reach ourselves
+        key = _answer_key(prompt, pages)
+        cached = self.answer_cache.get(key)
+        if cached is not None:
+            text, created_at = cached
+            logging.warning(f"Web fetch answer cache hit ({self.answer_cache.stats()})")
+            age_minutes = (time.time() - created_at) / 60
+            return {
+                "type": "text",
+                "text": f"{text}\n\n(Answer from {age_minutes:.0f} minutes ago; the pages have not changed since.)",
+            }
+        try:
+            answer = await self._process_pages(prompt, [(page.url, page.text) for page in pages])
+        except Exception as ex:
+            logging.warning(f"Answering from cached pages failed, fetching with Gemini instead: {ex!r}")
+            return None
+        if not answer.strip():
+            return None
+        text = f"Web fetch results for prompt:\n\n{answer}\n\nFetched directly:\n" + "\n".join(page.url for page in pages)
+        self.answer_cache.put(key, text)
+        return {"type": "text", "text": text}
+
+    async def _fetch_with_url_context(self, prompt: str, urls: list[str]):
         # Tool call: tries Gemini API with urlContext first
         grounding_tool = types.Tool(url_context=types.UrlContext())
         tool_config = types.ToolConfig(
@@ -63,11 +157,9 @@ class WebFetchTool():
 
         # Make Gemini request
         try:
-            response = self.gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=prompt,
-                config=config,
-            )
+            response = await self._generate(prompt, config)
+        except asyncio.TimeoutError:
+            return await self._fallback_fetch(prompt, f"Gemini timed out after {REQUEST_TIMEOUT:.0f} seconds")
         except Exception as ex:
             return await self._fallback_fetch(prompt, f"Gemini error: {ex}")
 
@@ -138,58 +230,191 @@ class WebFetchTool():
                 fetched_urls_section += "\n\nFetched URLs:\n" + fetched_urls
 
         modified_response_text += sources_section + fetched_urls_section
+        text = f'Web fetch results for prompt:\n\n{modified_response_text}'
+
+        # Gemini fetched the pages itself; with `prefetch` they're fetched once more in the background
+        # to have their validators and content hashes for next time
+        if urls and self.prefetch:
+            task = asyncio.create_task(self._remember(prompt, urls, text))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
 
         return {
             "type": "text",
-            "text": f'Web fetch results for prompt:\n\n{modified_response_text}',
+            "text": text,
         }
 
+    async def _remember(self, prompt: str, urls: list[str], text: str) -> None:
+        try:
+            async with self._session() as session:
+                pages, failures = await self._fetch_pages(session, urls)
+        except Exception as ex:
+            logging.warning(f"Could not cache pages for {urls}: {ex!r}")
+            return
+        if not failures:
+            self.answer_cache.put(_answer_key(prompt, pages), text)
+
+    async def stop(self) -> None:
+        """Cancel background page caching and close the answer cache."""
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self.answer_cache.close()
+
+    async def _generate(self, contents, config=None):
+        """One Gemini call on the async client, limited in concurrency and time."""
+        async with self.request_semaphore:
+            return await asyncio.wait_for(
+                self.gemini_client.aio.models.generate_content(
+                    model=MODEL,
+                    contents=contents,
+                    config=config,
+                ),
+                REQUEST_TIMEOUT,
+            )
+
+    @contextlib.asynccontextmanager
+    async def _session(self):
+        """Yield the shared session if there is one, otherwise a throwaway one."""
+        if self.http_session is not None:
+            yield self.http_session
+            return
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context, limit_per_host=PER_HOST_LIMIT)) as session:
+            yield session
+
+    async def _fetch_text(self, session: aiohttp.ClientSession, url: str) -> CachedPage:
+        """
+        Download a page and return its readable text, parsing HTML as it streams in. Pages in the HTTP
+        cache are revalidated with a conditional request, or not requested at all while still fresh.
+        """
+        cached = self.http_cache.get(url)
+        if cached is not None and cached.fresh:
+            return cached
+        async with self._host_semaphores[urlsplit(url).hostname]:
+            headers = self.http_cache.conditional_headers(cached)
+            async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT)) as resp:
+                if resp.status == 304 and cached is not None:
+                    return self.http_cache.refresh(cached, resp.headers)
+                if resp.status != 200:
+                    raise Exception(f"Fetch failed: HTTP {resp.status}")
+                content_type = resp.headers.get("Content-Type", "").lower()
+                if "application/pdf" in content_type:
+                    raise Exception("the URL is a PDF; download it with bash_tool and read it with datasheet_query_tool")
+                try:
+                    decoder = codecs.getincrementaldecoder(resp.charset or "utf-8")(errors="replace")
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                extractor = HTMLTextExtractor() if "html" in content_type else None
+                content_hash = hashlib.sha256()
+                parts = []
+                size = 0
+                truncated = False
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    content_hash.update(chunk)
+                    text = decoder.decode(chunk)
+                    if extractor is not None:
+                        extractor.feed(text)
+                    else:
+                        parts.append(text)
+                    if size >= MAX_PAGE_BYTES:
+                        logging.warning(f"Stopped reading {url} after {size} bytes")
+                        truncated = True
+                        break
+        text = extractor.text() if extractor is not None else "".join(parts)
+        if truncated:
+            # Don't cache a partial page against the full page's validators
+            return CachedPage(url, text, content_hash.hexdigest(), None, None, 0)
+        return self.http_cache.store(url, resp.headers, text, content_hash.hexdigest())
+
+    async def _fetch_pages(self, session: aiohttp.ClientSession, urls: list[str]) -> tuple[list[CachedPage], list[str]]:
+        """Fetch all URLs concurrently; return the pages with text and descriptions of the ones that failed."""
+        results = await asyncio.gather(*[self._fetch_text(session, url) for url in urls], return_exceptions=True)
+        pages = []
+        failures = []
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                failures.append(f"{url} ({result or type(result).__name__})")
+            elif result.text.strip():
+                pages.append(result)
+            else:
+                failures.append(f"{url} (no text content)")
+        return pages, failures
+
     async def _fallback_fetch(self, prompt, error_message):
-        urls = extract_urls(prompt)
+        urls = _prompt_urls(prompt)
         if not urls:
             return {
                 "type": "text",
                 "text": "Error: No URL found in the prompt.",
             }
-        url = urls[0]
-        # GitHub blob->raw conversion
-        if "github.com" in url and "/blob/" in url:
-            url = url.replace("github.com", "raw.githubusercontent.com").replace("/blob/", "/")
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=10) as resp:
-                    if resp.status != 200:
-                        raise Exception(f"Fetch failed: HTTP {resp.status}")
-                    html = await resp.text()
-                    # Strip tags: very basic, not full-featured
-                    text = re.sub(r'<[^>]+>', '', html)[:100000]
-        except Exception as ex:
+        async with self._session() as session:
+            pages, failures = await self._fetch_pages(session, urls)
+        failures_section = ("\n\nCould not fetch:\n" + "\n".join(failures)) if failures else ""
+        if not pages:
             return {
                 "type": "text",
-                "text": f"Error during fallback fetch for {url}: {ex}",
+                "text": f"Error during fallback fetch: {error_message}{failures_section}",
             }
-        # Ask Gemini to process raw content
-        fallback_prompt = f"""The user requested: "{prompt}"
 
-I was unable to access the URL directly. Instead, I have fetched the raw content of the page. Please use the following content to answer the user's request. Do not attempt to access the URL again.
-
----
-{text}
----
-"""
         try:
-            response = self.gemini_client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=fallback_prompt,
-            )
-            fallback_response_text = response.text or ''
+            answer = await self._process_pages(prompt, [(page.url, page.text) for page in pages])
+        except asyncio.TimeoutError:
+            return {
+                "type": "text",
+                "text": f"Error: Processing the fallback content timed out after {REQUEST_TIMEOUT:.0f} seconds.{failures_section}",
+            }
         except Exception as ex:
             return {
                 "type": "text",
-                "text": f"Error: Could not process fallback content for {url}: {ex}",
+                "text": f"Error: Could not process fallback content: {ex}{failures_section}",
             }
+        fetched_section = "\n\nFetched directly:\n" + "\n".join(page.url for page in pages)
+        text = (answer or "Fetched and processed the content.") + fetched_section + failures_section
+        if answer and not failures:
+            self.answer_cache.put(_answer_key(prompt, pages), text)
         return {
             "type": "text",
-            "text": fallback_response_text or f"Fetched and processed content for {url}."
+            "text": text,
         }
 
+    async def _process_pages(self, prompt: str, pages: list[tuple[str, str]]) -> str:
+        """
+        Ask Gemini to answer the prompt from the fetched pages. Small inputs go in one call; large ones
+        are split into chunks whose relevant parts are extracted concurrently, then combined in a final call.
+        """
+        chunks = [(url, chunk) for url, text in pages for chunk in chunk_text(text, CHUNK_CHARS)]
+        if len(chunks) <= 2:
+            content = "\n\n".join(f"--- Content of {url} ---\n{chunk}" for url, chunk in chunks)
+            response = await self._generate(FALLBACK_PROMPT.format(prompt=prompt, content=content))
+            return response.text or ""
+
+        responses = await asyncio.gather(*[
+            self._generate(EXTRACT_PROMPT.format(prompt=prompt, url=url, part=index + 1, parts=len(chunks), content=chunk))
+            for index, (url, chunk) in enumerate(chunks)
+        ])
+        notes = "\n\n".join(
+            f"--- Notes from part {index + 1} ({url}) ---\n{response.text}"
+            for index, ((url, _), response) in enumerate(zip(chunks, responses))
+            if response.text and response.text.strip() != "NOTHING RELEVANT"
+        )
+        response = await self._generate(FALLBACK_PROMPT.format(prompt=prompt, content=notes or "(no relevant content found)"))
+        return response.text or ""
+
+
+def _prompt_urls(prompt: str) -> list[str]:
+    return [_raw_github_url(url) for url in dict.fromkeys(extract_urls(prompt))][:MAX_URLS]
+
+
+def _answer_key(prompt: str, pages: list[CachedPage]) -> str:
+    """Answers are memoized per prompt and exact version of every page it was answered from."""
+    versions = sorted((page.url, page.content_hash) for page in pages)
+    return hashlib.sha256(json.dumps([MODEL, " ".join(prompt.split()), versions]).encode()).hexdigest()
+
+
+def _raw_github_url(url: str) -> str:
+    # GitHub blob->raw conversion
+    if "github.com" in url and "/blob/" in url:
+        return url.replace("github.com", "raw.githubusercontent.com").replace("/blob/", "/")
+    return url
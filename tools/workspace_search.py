@@ -0,0 +1,353 @@
+import os
+import re
+import time
+import pickle
+import asyncio
+import fnmatch
+import logging
+from array import array
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+from .base import ToolError
+
+INDEX_VERSION = 2
+MAX_INDEXED_BYTES = 1024 * 1024  # bigger files aren't trigram-indexed, just scanned on every search
+BINARY_SNIFF_BYTES = 8192
+DEFAULT_MAX_RESULTS = 200
+MAX_LINE_CHARS = 250
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _required_literals(items) -> list[str]:
+    """Literal strings (3+ chars) that every match of the parsed regex must contain."""
+    literals = []
+    current = []
+
+    def flush():
+        if len(current) >= 3:
+            literals.append("".join(current))
+        current.clear()
+
+    for op, arg in items:
+        if op is sre_constants.LITERAL:
+            current.append(chr(arg))
+        elif op is sre_constants.SUBPATTERN:
+            flush()
+            literals += _required_literals(arg[-1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and arg[0] >= 1:
+            flush()
+            literals += _required_literals(arg[2])
+        elif op is sre_constants.AT:
+            continue  # anchors don't consume characters
+        else:
+            flush()
+    flush()
+    return literals
+
+
+def _query_trigrams(regex: re.Pattern) -> set[str]:
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return set()
+    trigrams = set()
+    for literal in _required_literals(parsed):
+        trigrams |= _trigrams(literal.lower())
+    return trigrams
+
+
+def _glob_matches(path: str, pattern: str) -> bool:
+    """Match like a shell glob; a pattern without '/' matches the file name at any depth, '**/' also matches no directory."""
+    if "/" not in pattern:
+        return fnmatch.fnmatch(os.path.basename(path), pattern)
+    pattern = pattern.removeprefix("./")
+    return fnmatch.fnmatch(path, pattern) or ("**/" in pattern and fnmatch.fnmatch(path, pattern.replace("**/", "")))
+
+
+class TrigramIndex:
+    """
+    Maps every 3-character sequence (lowercased) to the files containing it, so a search only
+    opens the files that can possibly match. Files are re-indexed when their mtime or size
+    changes; hidden directories (including `.actualCodeDownloads` and `.pio`) are skipped.
+
+    Posting lists are arrays of file ids rather than sets: ids only grow, so appends keep them
+    sorted, and arrays aren't traversed by the garbage collector, which would otherwise stall
+    on millions of small sets. Re-indexed and deleted files leave stale ids behind; they're
+    ignored at query time and swept out once they outnumber the live ones. The index is
+    pickled to `index_path` so a restart doesn't re-read the whole workspace.
+    """
+
+    def __init__(self, workspace_directory: str, index_path: str | None = None):
+        self.workspace_directory = workspace_directory
+        self.index_path = index_path
+        self._files = {}  # relative path -> (mtime_ns, size, file id, or None for binary files)
+        self._paths = {}  # live file id -> relative path
+        self._large = set()  # ids of files too big to index, always searched
+        self._postings = {}  # trigram -> array of file ids (may include stale ones)
+        self._next_id = 0
+        self._stale = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("version") != INDEX_VERSION:
+                return
+            self._files, self._paths, self._large, self._postings, self._next_id, self._stale = (
+                state["files"], state["paths"], state["large"], state["postings"], state["next_id"], state["stale"]
+            )
+        except Exception as e:
+            logging.warning(f"Rebuilding unreadable search index {self.index_path}: {e}")
+
+    def save(self) -> None:
+        if self.index_path is None:
+            return
+        state = {
+            "version": INDEX_VERSION, "files": self._files, "paths": self._paths, "large": self._large,
+            "postings": self._postings, "next_id": self._next_id, "stale": self._stale,
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def file_count(self) -> int:
+        return len(self._files)
+
+    def paths(self) -> list[str]:
+        return sorted(self._files)
+
+    def refresh(self) -> int:
+        """Bring the index up to date with the workspace. Returns the number of files (re)indexed or removed."""
+        seen = {}
+        self._walk(self.workspace_directory, "", seen)
+        changes = 0
+        for path in [path for path in self._files if path not in seen]:
+            self._remove(path)
+            changes += 1
+        for path, (mtime_ns, size) in seen.items():
+            known = self._files.get(path)
+            if known is not None and known[0] == mtime_ns and known[1] == size:
+                continue
+            if known is not None:
+                self._remove(path)
+            self._add(path, mtime_ns, size)
+            changes += 1
+        if self._stale > len(self._paths):
+            self._sweep()
+        return changes
+
+    def _walk(self, directory: str, prefix: str, seen: dict) -> None:
+        try:
+            iterator = os.scandir(directory)
+        except OSError:
+            return
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            self._walk(entry.path, prefix + entry.name + "/", seen)
+                    elif entry.is_file() and not entry.name.startswith(".actualCode"):
+                        stat = entry.stat()
+                        seen[prefix + entry.name] = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    continue
+
+    def _add(self, path: str, mtime_ns: int, size: int) -> None:
+        try:
+            with open(os.path.join(self.workspace_directory, path), "rb") as f:
+                data = f.read(MAX_INDEXED_BYTES + 1)
+        except OSError:
+            return
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            self._files[path] = (mtime_ns, size, None)
+            return
+        file_id = self._next_id
+        self._next_id += 1
+        self._files[path] = (mtime_ns, size, file_id)
+        self._paths[file_id] = path
+        if len(data) > MAX_INDEXED_BYTES:
+            self._large.add(file_id)
+            return
+        for trigram in _trigrams(data.decode(errors="replace").lower()):
+            postings = self._postings.get(trigram)
+            if postings is None:
+                self._postings[trigram] = array("I", (file_id,))
+            else:
+                postings.append(file_id)
+
+    def _remove(self, path: str) -> None:
+        file_id = self._files.pop(path)[2]
+        if file_id is not None:
+            del self._paths[file_id]
+            self._large.discard(file_id)
+            self._stale += 1
+
+    def _sweep(self) -> None:
+        live = self._paths.keys()
+        postings = {}
+        for trigram, ids in self._postings.items():
+            ids = array("I", [file_id for file_id in ids if file_id in live])
+            if ids:
+                postings[trigram] = ids
+        self._postings = postings
+        self._stale = 0
+
+    def candidates(self, trigrams: set[str]) -> list[str]:
+        """Paths of the text files that contain all `trigrams` (plus the unindexed large ones)."""
+        if trigrams:
+            posting_lists = sorted((self._postings.get(trigram, ()) for trigram in trigrams), key=len)
+            ids = set(posting_lists[0])
+            for postings in posting_lists[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(postings)
+            ids = (ids & self._paths.keys()) | self._large
+        else:
+            ids = self._paths.keys()
+        return sorted(self._paths[file_id] for file_id in ids)
+
+
+class WorkspaceSearchTool():
+    def __init__(self, workspace_directory: str):
+        self.workspace_directory = workspace_directory
+        self.index = TrigramIndex(workspace_directory, os.path.join(workspace_directory, ".actualCodeSearchIndex"))
+        self._lock = asyncio.Lock()
+        self.definitions = [{
+            "name": "workspace_search_tool",
+            "description": f"Searches the files in the workspace directory {self.workspace_directory} (like grep and glob, but much faster, backed by an index). Give `pattern` to find matching lines, with file paths and line numbers; give only `glob` to list files by name. Hidden directories are skipped. Prefer this over grep/find in bash_tool.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pattern": {
+                        "type": "string",
+                        "description": "Python regular expression to search for, matched against each file's content (use `literal` to search for the exact text instead). ^ and $ match at line boundaries."
+                    },
+                    "glob": {
+                        "type": "string",
+                        "description": "Optional. Only search files whose path matches this glob, e.g. '*.cpp' or 'src/**/*.h'. Without a `pattern`, lists the matching files."
+                    },
+                    "path": {
+                        "type": "string",
+                        "description": f"Optional. Only search inside this directory, relative to {self.workspace_directory}."
+                    },
+                    "literal": {
+                        "type": "boolean",
+                        "description": "Optional. Treat `pattern` as plain text rather than a regular expression. Defaults to false."
+                    },
+                    "ignore_case": {
+                        "type": "boolean",
+                        "description": "Optional. Case-insensitive matching. Defaults to false."
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": f"Optional. Maximum number of matching lines (or files) to return. Defaults to {DEFAULT_MAX_RESULTS}."
+                    }
+                },
+                "required": []
+            }
+        }]
+
+    async def __call__(
+        self,
+        *,
+        pattern: str | None = None,
+        glob: str | None = None,
+        path: str | None = None,
+        literal: bool = False,
+        ignore_case: bool = False,
+        max_results: int | None = None,
+        **kwargs,
+    ):
+        if not pattern and not glob:
+            raise ToolError("At least one of `pattern` or `glob` is required.")
+        max_results = int(max_results or DEFAULT_MAX_RESULTS)
+        prefix = os.path.normpath(path).strip("/") + "/" if path and os.path.normpath(path) != "." else ""
+        if prefix.startswith("../"):
+            raise ToolError(f"The path {path} is outside the workspace directory.")
+        regex = None
+        if pattern:
+            try:
+                regex = re.compile(re.escape(pattern) if literal else pattern, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+            except re.error as e:
+                raise ToolError(f"Invalid regular expression {pattern!r}: {e}") from None
+
+        async with self._lock:
+            start_time = time.time()
+            changes = await asyncio.to_thread(self.index.refresh)
+            if changes:
+                logging.warning(f"Search index: {changes} files updated")
+                await asyncio.to_thread(self.index.save)
+            if regex is None:
+                return {"type": "text", "text": self._list_files(prefix, glob, max_results, start_time)}
+            return {"type": "text", "text": await asyncio.to_thread(self._search, regex, prefix, glob, max_results, start_time)}
+
+    def _list_files(self, prefix: str, glob: str, max_results: int, start_time: float) -> str:
+        paths = [path for path in self.index.paths() if path.startswith(prefix) and _glob_matches(path, glob)]
+        elapsed = (time.time() - start_time) * 1000
+        if not paths:
+            return f"No files match {glob!r}."
+        text = f"{len(paths)} files match {glob!r} ({elapsed:.0f} ms):\n" + "\n".join(paths[:max_results])
+        if len(paths) > max_results:
+            text += f"\n[{len(paths) - max_results} more files not shown]"
+        return text
+
+    def _search(self, regex: re.Pattern, prefix: str, glob: str | None, max_results: int, start_time: float) -> str:
+        candidates = [
+            path for path in self.index.candidates(_query_trigrams(regex))
+            if path.startswith(prefix) and (glob is None or _glob_matches(path, glob))
+        ]
+        results = []
+        matched_files = 0
+        truncated = False
+        for path in candidates:
+            try:
+                with open(os.path.join(self.workspace_directory, path), "rb") as f:
+                    text = f.read().decode(errors="replace")
+            except OSError:
+                continue
+            file_matched = False
+            line_number = 1
+            line_start = 0
+            last_line = 0
+            for match in regex.finditer(text):
+                line_number += text.count("\n", line_start, match.start())
+                line_start = text.rfind("\n", 0, match.start()) + 1
+                if line_number == last_line:
+                    continue
+                last_line = line_number
+                line_end = text.find("\n", match.start())
+                line = text[line_start:line_end if line_end != -1 else len(text)].rstrip("\r")
+                if len(line) > MAX_LINE_CHARS:
+                    line = line[:MAX_LINE_CHARS] + "..."
+                results.append(f"{path}:{line_number}: {line}")
+                file_matched = True
+                if len(results) >= max_results:
+                    truncated = True
+                    break
+            matched_files += file_matched
+            if truncated:
+                break
+
+        elapsed = (time.time() - start_time) * 1000
+        stats = f"searched {len(candidates)} of {self.index.file_count} files in {elapsed:.0f} ms"
+        if not results:
+            return f"No matches for {regex.pattern!r} ({stats})."
+        header = f"{len(results)} matching lines in {matched_files} files ({stats})"
+        if truncated:
+            header += f". Stopped at {max_results} results; narrow the search with `path` or `glob` to see more"
+        return header + ":\n" + "\n".join(results)
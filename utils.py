@@ -1,73 +1,40 @@
-import pickle
 import os
 import time
 import logging
-import aiohttp
-import aiofiles
-import asyncio
-from urllib.parse import urlparse
-from tools.run import run
+import atexit
+from journal import MessageJournal
 import platform, socket, re, uuid, json, psutil
-import certifi
-import ssl
 
 
-def load_messages(file_path: str) -> list:
-    startTime = time.time()
-    if not os.path.exists(file_path): return []
-    with open(file_path, "rb") as f:
-        messages = pickle.load(f)
-        logging.warning(f"loading messages took {time.time() - startTime}")
-        return messages
+_journals: dict[str, MessageJournal] = {}
 
 
-def save_messages(file_path: str, messages: list) -> None:
-    startTime = time.time()
-    with open(file_path, "wb") as f:
-        pickle.dump(messages, f)
-        logging.warning(f"saving messages to disk took {time.time() - startTime}")
-        return 
-    
-    
+def _get_journal(file_path: str) -> MessageJournal:
+    journal = _journals.get(file_path)
+    if journal is None:
+        journal = _journals[file_path] = MessageJournal(file_path)
+    return journal
 
 
-async def download_file(session, url, folder):
-    try:
-        # Get filename from URL
-        parsed = urlparse(url)
-        filename = os.path.basename(parsed.path)
-        if not filename:
-            filename = "downloaded_file"
-        dest_path = os.path.join(folder, filename)
-
-        async with session.get(url) as response:
-            response.raise_for_status()
-            async with aiofiles.open(dest_path, mode='wb') as f:
-                async for chunk in response.content.iter_chunked(1024):
-                    await f.write(chunk)
-        logging.warning(f"Downloaded {url} → {dest_path}")
-        return dest_path
-    except Exception as e:
-        logging.warning(f"Failed to download {url}: {e}")
-        return None
-
-async def download_files(urls, folder):
-    os.makedirs(folder, exist_ok=True)
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        tasks = [download_file(session, url, folder) for url in urls]
-        return await asyncio.gather(*tasks)
-
+def load_messages(file_path: str) -> list:
+    startTime = time.time()
+    # Load even when there's no file yet, so the journal knows it's empty and the first saves append
+    messages = _get_journal(file_path).load()
+    logging.warning(f"loading messages took {time.time() - startTime}")
+    return messages
 
 
-async def workspace_files(workspace_directory: str):
-    _, stdout, stderr = await run(
-        rf"cd {workspace_directory} && find ./ -maxdepth 2 -not -path '*/\.*'"
-    )
-    outputStr = f"Here's the files and directories up to 2 levels deep in workspace directory({workspace_directory}), excluding hidden items:\n{stdout}\n"
-    return outputStr
+def save_messages(file_path: str, messages: list) -> None:
+    """Append the entries of `messages` that aren't on disk yet to the journal at `file_path`."""
+    startTime = time.time()
+    _get_journal(file_path).save(messages)
+    logging.warning(f"saving messages to disk took {time.time() - startTime}")
 
 
+@atexit.register
+def _close_journals() -> None:
+    for journal in _journals.values():
+        journal.close()
 
 
 def getSystemInfo():
@@ -0,0 +1,223 @@
+import os
+import sys
+import errno
+import struct
+import ctypes
+import logging
+
+MAX_DELTA_ENTRIES = 200
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+
+
+def scan_tree(directory: str, max_depth: int = 2, prefix: str = ".") -> dict[str, tuple[bool, int, int]]:
+    """
+    In-process equivalent of `find <prefix> -maxdepth <max_depth> -not -path '*/\\.*'`.
+    Returns {path: (is_dir, mtime_ns, size)} with paths relative to the parent of `directory`.
+    """
+    entries = {}
+    _scan_into(entries, directory, prefix, 1, max_depth)
+    return entries
+
+
+def _scan_into(entries: dict, directory: str, prefix: str, depth: int, max_depth: int) -> None:
+    try:
+        iterator = os.scandir(directory)
+    except OSError:
+        return
+    with iterator:
+        for entry in iterator:
+            if entry.name.startswith("."):
+                continue
+            path = f"{prefix}/{entry.name}"
+            try:
+                is_dir = entry.is_dir()
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries[path] = (is_dir, stat.st_mtime_ns, stat.st_size)
+            if is_dir and depth < max_depth:
+                _scan_into(entries, entry.path, path, depth + 1, max_depth)
+
+
+def render_tree(entries: dict, root: str = "./") -> str:
+    return "\n".join([root] + sorted(entries))
+
+
+class _Inotify:
+    """Minimal ctypes binding for inotify; reports which watched directories changed."""
+
+    _event = struct.Struct("iIII")
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches = {}  # wd -> directory key
+
+    def add_watch(self, path: str, key: str) -> None:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._watches[wd] = key
+
+    def read_changes(self) -> tuple[set[str], bool]:
+        """Return (directories with events, whether the queue overflowed)."""
+        changed = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            offset = 0
+            while offset + self._event.size <= len(data):
+                wd, mask, _, length = self._event.unpack_from(data, offset)
+                offset += self._event.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                key = self._watches.get(wd)
+                if key is not None:
+                    changed.add(key)
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+        return changed, overflow
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class WorkspaceIndex:
+    """
+    Keeps the workspace tree (up to `max_depth` levels, hidden entries excluded) in memory
+    and reports what changed between turns. On Linux, inotify tells it which directories
+    to rescan; elsewhere it falls back to a full `os.scandir` walk, which is still far
+    cheaper than forking `find`.
+    """
+
+    def __init__(self, workspace_directory: str, max_depth: int = 2):
+        self.workspace_directory = workspace_directory
+        self.max_depth = max_depth
+        self._entries = None
+        self._sent = None  # the tree as of the last render
+        self._inotify = None
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                logging.warning(f"inotify unavailable, falling back to scandir: {e}")
+
+    def _watch_all(self) -> None:
+        self._inotify.add_watch(self.workspace_directory, ".")
+        for path, (is_dir, _, _) in self._entries.items():
+            if is_dir and path.count("/") < self.max_depth:
+                self._watch(path)
+                if self._inotify is None:
+                    break
+
+    def _watch(self, path: str) -> None:
+        try:
+            self._inotify.add_watch(self._absolute(path), path)
+        except OSError as e:
+            logging.warning(f"inotify watch failed, falling back to scandir: {e}")
+            self._inotify.close()
+            self._inotify = None
+
+    def _absolute(self, path: str) -> str:
+        return os.path.join(self.workspace_directory, path[2:]) if path != "." else self.workspace_directory
+
+    def refresh(self) -> dict:
+        """Bring the in-memory tree up to date and return it."""
+        if self._entries is None or self._inotify is None:
+            self._entries = scan_tree(self.workspace_directory, self.max_depth)
+            if self._inotify is not None:
+                self._watch_all()
+            return self._entries
+
+        changed, overflow = self._inotify.read_changes()
+        if overflow:
+            self._entries = scan_tree(self.workspace_directory, self.max_depth)
+            self._inotify.close()
+            self._inotify = _Inotify()
+            self._watch_all()
+            return self._entries
+        for directory in sorted(changed, key=lambda path: path.count("/")):
+            self._rescan(directory)
+        return self._entries
+
+    def _rescan(self, directory: str) -> None:
+        """Re-read the direct children of `directory`, descending only into directories that are new."""
+        depth = 0 if directory == "." else directory.count("/")
+        if directory != "." and not os.path.isdir(self._absolute(directory)):
+            return  # removed; its parent's rescan drops it
+        children = {}
+        _scan_into(children, self._absolute(directory), directory, depth + 1, depth + 1)
+        prefix = directory + "/"
+        old_children = [path for path in self._entries if path.startswith(prefix) and "/" not in path[len(prefix):]]
+        for path in old_children:
+            if path not in children:
+                self._remove(path)
+        for path, value in children.items():
+            is_new_dir = value[0] and not self._entries.get(path, (False,))[0]
+            self._entries[path] = value
+            if is_new_dir and depth + 1 < self.max_depth:
+                _scan_into(self._entries, self._absolute(path), path, depth + 2, self.max_depth)
+                if self._inotify is not None:
+                    self._watch(path)
+
+    def _remove(self, path: str) -> None:
+        prefix = path + "/"
+        for child in [child for child in self._entries if child.startswith(prefix)]:
+            del self._entries[child]
+        self._entries.pop(path, None)
+
+    def render(self, full: bool = False) -> str:
+        """Describe the workspace for the model: the full tree, or only what changed since the last render."""
+        entries = self.refresh()
+        previous, self._sent = self._sent, dict(entries)
+        if full or previous is None:
+            return f"Here's the files and directories up to {self.max_depth} levels deep in workspace directory({self.workspace_directory}), excluding hidden items:\n{render_tree(entries)}\n"
+
+        added = sorted(path for path in entries if path not in previous)
+        removed = sorted(path for path in previous if path not in entries)
+        modified = sorted(
+            path for path, (is_dir, mtime, size) in entries.items()
+            if not is_dir and path in previous and previous[path] != (is_dir, mtime, size)
+        )
+        if not (added or removed or modified):
+            return f"No changes in workspace directory({self.workspace_directory}) since last turn.\n"
+        lines = [f"Changes in workspace directory({self.workspace_directory}) since last turn, excluding hidden items:"]
+        for label, paths in (("added", added), ("removed", removed), ("modified", modified)):
+            if not paths: continue
+            lines.append(f"{label}:")
+            lines += paths[:MAX_DELTA_ENTRIES]
+            if len(paths) > MAX_DELTA_ENTRIES:
+                lines.append(f"... and {len(paths) - MAX_DELTA_ENTRIES} more")
+        return "\n".join(lines) + "\n"
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None